@@ -1,6 +1,13 @@
 from abc import ABC, abstractmethod
+import asyncio
+import io
+import json
+import posixpath
 import typing
-from threading import Thread
+import urllib.parse
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
 
 import bs4
 import ebooklib
@@ -9,19 +16,70 @@ from ebooklib import epub
 from .descengine.descengine import DescEngine
 from .ocrengine.ocrengine import OCREngine
 from .langengine.langengine import LangEngine
+from .cache import ResultCache, getDigest
+from .imagestore import ImageStore
+from .htmlstream import iterImgs, setAttr, sniffEncoding
+from .epubwriter import writeEpub
+from .lazyepub import LazyEpub
+from .scheduler import Scheduler
 
 
 DEFOPTIONS = {
     "withContext": True,
     "withHash": True,
     "multiThreaded": True,
+    "maxWorkers": 8,
+    "queueDepth": 16,
+    "taskTimeout": None,
+    "asyncConcurrency": 64,
+    "parallelStages": True,
+    "cachePath": None,
+    "cacheSize": 256 * 1024 * 1024,
+    "dedupe": True,
+    "descBatchSize": 0,
+    "refineBatchSize": 0,
+    "imgCacheSize": 64 * 1024 * 1024,
+    "parser": "html.parser",
+    "imgScan": False,
+    "exportMode": "prettify",
+    "epubLoad": "eager",
     "version": 2,
 }
 
 
 ### ALTTEXT CLASSES
 class AltText(ABC):
-    @abstractmethod
+    def __init__(
+        self,
+        descEngine: DescEngine,
+        ocrEngine: OCREngine = None,
+        langEngine: LangEngine = None,
+        options: dict = {},
+    ) -> None:
+        self.data = None
+
+        self.descEngine = descEngine
+        self.ocrEngine = ocrEngine
+        self.langEngine = langEngine
+
+        self.options = dict(DEFOPTIONS)
+        for key in dict.keys(options):
+            self.options[key] = options[key]
+
+        self.stagePool = None
+        self.stagePoolSize = None
+        self.stagePoolLock = Lock()
+        self.cache = None
+        self.cacheLock = Lock()
+        self.imgStore = None
+        self.prefetchedDescs = {}
+        self.prefetchedChars = {}
+        self.prefetchedAlts = {}
+        self.analyses = {}
+        self.analysisLock = Lock()
+
+        return None
+
     def setDescEngine(self, descEngine: DescEngine) -> bool:
         """Sets current description engine.
 
@@ -31,9 +89,9 @@ class AltText(ABC):
         Returns:
             bool: True if successful.
         """
-        pass
+        self.descEngine = descEngine
+        return True
 
-    @abstractmethod
     def setOCREngine(self, ocrEngine: OCREngine) -> bool:
         """Sets current OCR engine.
 
@@ -43,9 +101,9 @@ class AltText(ABC):
         Returns:
             bool: True if successful.
         """
-        pass
+        self.ocrEngine = ocrEngine
+        return True
 
-    @abstractmethod
     def setLangEngine(self, langEngine: LangEngine) -> bool:
         """Sets current language engine.
 
@@ -55,9 +113,9 @@ class AltText(ABC):
         Returns:
             bool: True if successful.
         """
-        pass
+        self.langEngine = langEngine
+        return True
 
-    @abstractmethod
     def setOptions(self, options: dict) -> bool:
         """Sets current options.
 
@@ -67,7 +125,31 @@ class AltText(ABC):
         Returns:
             bool: True if successful.
         """
-        pass
+        for key in dict.keys(options):
+            self.options[key] = options[key]
+        if "maxWorkers" in options or "parallelStages" in options:
+            self.__releaseStagePool()
+        return True
+
+    def close(self) -> bool:
+        """Releases the worker threads, cache connection, and open files held by this instance.
+        Worker threads and the cache are created again if it is used afterwards, but a zipped or lazily loaded book must be parsed again.
+
+        Returns:
+            bool: True if successful.
+        """
+        self.__releaseStagePool()
+        with self.cacheLock:
+            if self.cache != None:
+                self.cache.close()
+                self.cache = None
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
 
     @abstractmethod
     def checkData(self) -> bool:
@@ -101,7 +183,7 @@ class AltText(ABC):
         """Parses data from a file into a BeautifulSoup or EpubBook object.
 
         Args:
-            filepath (str): Path to HTML or EPUB file.
+            filepath (str): Path to HTML or EPUB file. AltTextHTML also accepts a zip archive holding the HTML file and its images.
 
         Returns:
             bs4.BeautifulSoup | epub.EpubBook: The BeautifulSoup or EpubBook object stored in self.data.
@@ -117,14 +199,18 @@ class AltText(ABC):
         """
         pass
 
-    @abstractmethod
     def getNoAltImgs(self) -> typing.List[bs4.element.Tag]:
         """Gets all img tags that either do not have an alt attribute or alt.strip() is an empty string.
 
         Returns:
             typing.List[bs4.element.Tag]: A list of img tags.
         """
-        pass
+        imgs = self.getAllImgs()
+        noalt = []
+        for img in imgs:
+            if not "alt" in img.attrs.keys() or img.attrs["alt"].strip() == "":
+                noalt.append(img)
+        return noalt
 
     @abstractmethod
     def getImg(self, src: str) -> bs4.element.Tag:
@@ -134,26 +220,30 @@ class AltText(ABC):
             src (str): Image source.
 
         Returns:
-            bs4.element.Tag: An img tag.
+            bs4.element.Tag: The first img tag with the src, or None if there is none.
         """
         pass
 
     @abstractmethod
     def setAlt(self, src: str, text: str) -> bs4.element.Tag:
-        """Sets the alt of an img tag given a src.
+        """Sets the alt of every img tag with a given src.
 
         Args:
             src (str): Image source.
             text (str): New alt-text.
 
         Returns:
-            bs4.element.Tag: Newly modified img tag.
+            bs4.element.Tag: The first newly modified img tag.
+
+        Raises:
+            Exception: If no img tag has the src.
         """
         pass
 
     @abstractmethod
     def setAlts(self, associations: list[dict]) -> list[bs4.element.Tag]:
         """Sets the alt of multiple img tags given a list of associations.
+        Every img tag with an association's src is set. Associations where "alt" is None (failed generations) are skipped.
 
         Args:
             associations (list[dict]): A list of associations. Must have keys "src" and "alt".
@@ -166,6 +256,7 @@ class AltText(ABC):
     @abstractmethod
     def export(self) -> typing.Union[str, epub.EpubBook]:
         """Exports the current data.
+        If "exportMode" is "splice", only changed alt attributes are written into the original documents instead of re-serializing them.
 
         Returns:
             str | epub.EpubBook: A string of HTML or an epub.EpubBook object.
@@ -213,19 +304,20 @@ class AltText(ABC):
     @abstractmethod
     def getImgData(self, src: str) -> bytes:
         """Gets byte data of an image given a src.
+        Each image is read once per document and kept in memory within the "imgCacheSize" budget.
 
         Args:
-            src (str): Image source.
+            src (str): Image source. For EPUBs, the path of the image within the package (its manifest href), as returned in associations.
 
         Returns:
             bytes: Image data as bytes.
         """
         pass
 
-    @abstractmethod
     def getContext(self, tag: bs4.Tag) -> list[str]:
         """Gets the context of an img tag.
         Context being the text immediately before and after the img tag.
+        Read from a table built by one pass over the tag's document, see getCaption.
 
         Args:
             tag (bs4.Tag): The img tag to get context for.
@@ -233,11 +325,76 @@ class AltText(ABC):
         Returns:
             list[str]: A list of length 2. The first element is the text immediately before the img tag. The second element is the text immediately after the img tag.
         """
-        pass
+        return list(self.__getAnalysis(self._resolveTag(tag))[0])
+
+    def getCaption(self, tag: bs4.Tag) -> str:
+        """Gets the caption of an img tag.
+        A caption is a <figcaption> or <caption> element, or an element with "caption" in its class, that is a direct child of a <figure> or other element (besides <body> and <html>) enclosing the img tag.
+        Only the nearest such element counts, and only if the img tag is the only image within it, so a caption is never shared by several images.
+
+        Args:
+            tag (bs4.Tag): The img tag to get the caption of.
+
+        Returns:
+            str: Text of the caption, or None if the img tag has no caption.
+        """
+        return self.__getAnalysis(self._resolveTag(tag))[1]
+
+    def _resolveTag(self, tag: bs4.element.Tag) -> bs4.element.Tag:
+        """Gets the img tag in the full document tree that a tag stands for.
+        Tags from an img-only scan (see "imgScan") have no surrounding document, so context is read from the full tag instead.
+
+        Args:
+            tag (bs4.element.Tag): An img tag.
+
+        Returns:
+            bs4.element.Tag: The img tag within its full document.
+        """
+        return tag
+
+    def __getAnalysis(self, tag: bs4.Tag) -> tuple[list[str], str]:
+        root = tag
+        while root.parent != None:
+            root = root.parent
+        with self.analysisLock:
+            analysis = self.analyses.get(id(root))
+            # a tag missing from the table was added after the document was analyzed
+            if (
+                analysis == None
+                or analysis[0] is not root
+                or id(tag) not in analysis[1]
+            ):
+                analysis = (root, analyzeDocument(root))
+                self.analyses[id(root)] = analysis
+        entry = analysis[1].get(id(tag))
+        if entry == None or entry[0] is not tag:
+            return [None, None], None
+        return entry[1], entry[2]
+
+    def __getCache(self) -> ResultCache:
+        if self.options["cachePath"] == None:
+            return None
+        with self.cacheLock:
+            if self.cache == None or self.cache.path != self.options["cachePath"]:
+                self.cache = ResultCache(
+                    self.options["cachePath"], self.options["cacheSize"]
+                )
+            return self.cache
+
+    def __cached(self, kind: str, parts: list, generate: typing.Callable):
+        cache = self.__getCache()
+        if cache == None:
+            return generate()
+        key = cache.makeKey(kind, *parts)
+        result = cache.get(key)
+        if result == None:
+            result = generate()
+            cache.set(key, kind, result)
+        return result
 
-    @abstractmethod
     def genChars(self, imgData: bytes, src: str) -> str:
         """Searches for characters in an image.
+        If "cachePath" is set, results are cached by image digest and OCR engine identity.
 
         Args:
             imgData (bytes): Image data as bytes.
@@ -246,11 +403,17 @@ class AltText(ABC):
         Returns:
             str: String of characters found in the image.
         """
-        pass
+        parts = [getDigest(imgData), self.ocrEngine.getIdentity()]
+        if tuple(parts) in self.prefetchedChars:
+            return self.prefetchedChars[tuple(parts)]
+        text = self.__cached(
+            "chars", parts, lambda: self.ocrEngine.genChars(imgData, src)
+        )
+        return text
 
-    @abstractmethod
     def genDesc(self, imgData: bytes, src: str, context: str = None) -> str:
         """Generates a description of an image.
+        If "cachePath" is set, results are cached by image digest and description engine identity.
 
         Args:
             imgData (bytes): Image data as bytes.
@@ -260,47 +423,198 @@ class AltText(ABC):
         Returns:
             str: Description of the image.
         """
-        pass
+        # description engines do not use context, so it is left out of the key
+        parts = [getDigest(imgData), self.descEngine.getIdentity()]
+        if tuple(parts) in self.prefetchedDescs:
+            return self.prefetchedDescs[tuple(parts)]
+        alt = self.__cached(
+            "desc", parts, lambda: self.descEngine.genDesc(imgData, src, context)
+        )
+        return alt
 
-    @abstractmethod
-    def genAltTextV1(self, src: str) -> str:
+    def __getStagePool(self) -> ThreadPoolExecutor:
+        with self.stagePoolLock:
+            # a pool sized for an earlier "maxWorkers" is replaced, as the cache is for "cachePath"
+            if (
+                self.stagePool != None
+                and self.stagePoolSize != self.options["maxWorkers"]
+            ):
+                self.stagePool.shutdown(wait=False)
+                self.stagePool = None
+            if self.stagePool == None:
+                self.stagePoolSize = self.options["maxWorkers"]
+                self.stagePool = ThreadPoolExecutor(max_workers=self.stagePoolSize)
+            return self.stagePool
+
+    def __releaseStagePool(self) -> None:
+        with self.stagePoolLock:
+            if self.stagePool != None:
+                # stages already submitted still finish
+                self.stagePool.shutdown(wait=False)
+                self.stagePool = None
+
+    def __runStages(self, *stages: typing.Callable) -> list:
+        if not self.options["parallelStages"]:
+            return [stage() for stage in stages]
+        # the first stage runs on the calling thread, so a worker never waits on the pool it belongs to
+        futures = [self.__getStagePool().submit(stage) for stage in stages[1:]]
+        results = [stages[0]()]
+        for future in futures:
+            results.append(future.result())
+        return results
+
+    def __altKeyParts(
+        self, version: int, src: str, context: list[str], caption: str = None
+    ) -> list:
+        parts = [
+            self.imgStore.getDigest(src),
+            version,
+            self.descEngine.getIdentity(),
+            self.ocrEngine.getIdentity() if self.ocrEngine != None else None,
+            self.langEngine.getIdentity() if self.langEngine != None else None,
+            context,
+        ]
+        # keys of results made without a caption are unchanged
+        if caption != None:
+            parts.append(caption)
+        return parts
+
+    def genAltTextV1(self, src: str, tag: bs4.element.Tag = None) -> str:
         """Generates alt-text for an image given its source.
         Uses V1 Dataflow model. This means the description and characters are generated and optionally refined separately.
+        If "parallelStages" is True, the description and character stages run concurrently.
 
         Args:
             src (str): Source of the image.
+            tag (bs4.element.Tag, optional): The img tag to take context from. Defaults to None, which uses the tag found by getImg.
 
         Returns:
             str: Generated alt-text for the image.
         """
-        pass
+        context = None
+        if self.options["withContext"]:
+            context = self.getContext(tag if tag != None else self.getImg(src))
+        return self.__genAltTextV1(src, context)
 
-    @abstractmethod
-    def genAltTextV2(self, src: str) -> str:
+    def __genAltTextV1(self, src: str, context: list[str]) -> str:
+        imgdata = self.getImgData(src)
+
+        def generate() -> str:
+            desc, chars = self.__runStages(describe, recognize)
+            alt = f"IMAGE CAPTION: {desc}"
+            if chars != None:
+                alt = f"{alt}\nTEXT IN IMAGE: {chars}"
+            return alt
+
+        def describe() -> str:
+            desc = self.genDesc(imgdata, src, context)
+            if self.langEngine != None:
+                desc = self.langEngine.refineDesc(desc)
+            return desc
+
+        def recognize() -> str:
+            if self.ocrEngine == None:
+                return None
+            chars = self.genChars(imgdata, src)
+            if self.langEngine != None:
+                chars = self.langEngine.refineOCR(chars)
+            return chars
+
+        return self.__cached("alt", self.__altKeyParts(1, src, context), generate)
+
+    def genAltTextV2(self, src: str, tag: bs4.element.Tag = None) -> str:
         """Generates alt-text for an image given its source.
         Uses V2 Dataflow model. This means the description and characters are generated and then alt-text is generated using both pieces of information.
+        If "parallelStages" is True, the description and characters are generated concurrently.
 
         Args:
             src (str): Source of the image.
+            tag (bs4.element.Tag, optional): The img tag to take context from. Defaults to None, which uses the tag found by getImg.
 
         Returns:
             str: Generated alt-text for the image.
         """
-        pass
+        if self.langEngine == None:
+            raise Exception("To use version 2, you must have a langEngine set.")
 
-    @abstractmethod
-    def genAltText(self, src: str) -> str:
+        context = [None, None]
+        caption = None
+        if self.options["withContext"]:
+            tag = tag if tag != None else self.getImg(src)
+            context = self.getContext(tag)
+            caption = self.getCaption(tag)
+        return self.__genAltTextV2(src, context, caption)
+
+    def __genAltTextV2(self, src: str, context: list[str], caption: str) -> str:
+        imgdata = self.getImgData(src)
+
+        def generate() -> str:
+            desc, chars = self.__gatherV2(imgdata, src, context)
+            return self.langEngine.refineAlt(desc, chars, context, caption)
+
+        parts = self.__altKeyParts(2, src, context, caption)
+        prefetched = self.prefetchedAlts.get(json.dumps(parts))
+        if prefetched != None:
+            return prefetched
+        return self.__cached("alt", parts, generate)
+
+    def __gatherV2(self, imgdata: bytes, src: str, context: list[str]) -> list[str]:
+        def recognize() -> str:
+            if self.ocrEngine == None:
+                return ""
+            return self.genChars(imgdata, src).strip()
+
+        return self.__runStages(lambda: self.genDesc(imgdata, src, context), recognize)
+
+    def genAltText(self, src: str, tag: bs4.element.Tag = None) -> str:
         """Generates alt-text for an image given its source and current options.
+        If "cachePath" is set, results are cached by image digest, engine identities, and context.
 
         Args:
             src (str): Source of the image.
+            tag (bs4.element.Tag, optional): The img tag to take context from. Defaults to None, which uses the tag found by getImg.
 
         Returns:
             str: Generated alt-text for the image.
         """
-        pass
+        if self.options["version"] == 1:
+            return self.genAltTextV1(src, tag)
+        return self.genAltTextV2(src, tag)
+
+    def _genAltTextWith(
+        self, src: str, context: list[str] = None, caption: str = None
+    ) -> str:
+        """Generates alt-text for an image given its source and already known context, for images that have no tag to take context from.
+
+        Args:
+            src (str): Source of the image.
+            context (list[str], optional): Text before and after the image, as returned by getContext. Defaults to None, which uses no context.
+            caption (str, optional): Caption of the image, as returned by getCaption. Defaults to None.
+
+        Returns:
+            str: Generated alt-text for the image.
+        """
+        if self.options["version"] == 1:
+            return self.__genAltTextV1(src, context)
+        if self.langEngine == None:
+            raise Exception("To use version 2, you must have a langEngine set.")
+        if context == None:
+            context = [None, None]
+        return self.__genAltTextV2(src, context, caption)
+
+    def _getTagSrc(self, tag: bs4.element.Tag) -> str:
+        """Gets the src that identifies an img tag's image to getImgData, getImg, and setAlt.
+
+        Args:
+            tag (bs4.element.Tag): An img tag.
+
+        Returns:
+            str: Image source.
+        """
+        if not "src" in tag.attrs:
+            raise Exception("img tag has no src attribute")
+        return tag.attrs["src"]
 
-    @abstractmethod
     def genAssociation(
         self,
         tag: bs4.element.Tag,
@@ -311,15 +625,16 @@ class AltText(ABC):
             tag (bs4.element.Tag): Image tag to make an association for.
 
         Returns:
-            dict: The association. Must have keys "src" and "alt". If "withHash" is True, must also have key "hash".
+            dict: The association. Must have keys "src" and "alt". If "withHash" is True, must also have key "hash", the SHA-256 hex digest of the image data.
         """
-        pass
+        src = self._getTagSrc(tag)
+        alt = self.genAltText(src, tag)
+        association = {"src": src, "alt": alt}
+        if self.options["withHash"]:
+            association["hash"] = self.imgStore.getDigest(src)
+        return association
 
-    @abstractmethod
-    def _genAltAssociationsST(
-        self,
-        tags: list[bs4.element.Tag],
-    ) -> list[dict]:
+    def _genAltAssociationsST(self, tags: list[bs4.element.Tag]) -> list[dict]:
         """Generates alt-text and creates associations given a list of img tags and current options.
         Single threaded implementation.
 
@@ -329,31 +644,82 @@ class AltText(ABC):
         Returns:
             list[dict]: List of associations. Must have keys "src" and "alt". If "withHash" is True, must also have key "hash".
         """
-        pass
+        associations = []
+        for tag in tags:
+            associations.append(self.genAssociation(tag))
+        return associations
 
-    @abstractmethod
     def _genAltAssociationsMT(
         self,
         tags: list[bs4.element.Tag],
     ) -> list[dict]:
         """Generates alt-text and creates associations given a list of img tags and current options.
-        Multi threaded implementation.
+        Multi threaded implementation. Runs on a bounded worker pool configured by "maxWorkers", "queueDepth" and "taskTimeout".
 
         Args:
             tags (list[bs4.element.Tag]): List of img tags to make associations for.
 
         Returns:
-            list[dict]: List of associations. Must have keys "src" and "alt". If "withHash" is True, must also have key "hash".
+            list[dict]: List of associations in the same order as tags. Must have keys "src" and "alt". If "withHash" is True, must also have key "hash". If generation failed for a tag, "alt" is None and key "error" describes the failure.
         """
-        pass
+        scheduler = Scheduler(
+            self.options["maxWorkers"],
+            self.options["queueDepth"],
+            self.options["taskTimeout"],
+        )
+
+        return scheduler.map(self.genAssociation, tags, self.__failedAssociation)
+
+    def __failedAssociation(self, tag: bs4.element.Tag, err: Exception) -> dict:
+        return {"src": self.__getAssociationSrc(tag), "alt": None, "error": str(err)}
+
+    def __getAssociationSrc(self, tag: bs4.element.Tag) -> str:
+        # tags without a usable src (e.g. <img data-src=...>) still get an association, carrying their error
+        try:
+            return self._getTagSrc(tag)
+        except Exception:
+            return tag.attrs.get("src")
+
+    def __planAssociations(
+        self, tags: list[bs4.element.Tag]
+    ) -> tuple[list[bs4.element.Tag], list[int]]:
+        uniqueTags = []
+        groups = []
+        srcGroups = {}
+        digestGroups = {}
+        for tag in tags:
+            try:
+                src = self._getTagSrc(tag)
+            except Exception:
+                # generated on its own, so the error is reported for this tag alone
+                groups.append(len(uniqueTags))
+                uniqueTags.append(tag)
+                continue
+            if src not in srcGroups:
+                try:
+                    digest = self.imgStore.getDigest(src)
+                except Exception:
+                    # leave unreadable images on their own, generation reports the error
+                    digest = None
+                if digest != None and digest in digestGroups:
+                    srcGroups[src] = digestGroups[digest]
+                else:
+                    srcGroups[src] = len(uniqueTags)
+                    uniqueTags.append(tag)
+                    if digest != None:
+                        digestGroups[digest] = srcGroups[src]
+            groups.append(srcGroups[src])
+        return uniqueTags, groups
 
-    @abstractmethod
     def genAltAssociations(
         self,
         tags: list[bs4.element.Tag],
     ) -> list[dict]:
         """Generates alt-text and creates associations given a list of img tags and current options.
         Automatically selects mutli or single threaded implementation based on current options.
+        If "dedupe" is True, tags sharing a src or identical image data are generated once (using the first such tag) and the result is given to each of them.
+        If "descBatchSize" is greater than 0, descriptions are first generated in batches of that size with the description engine's genDescMany.
+        If "refineBatchSize" is greater than 0 and "version" is 2, alt-text is then refined in batches of that size with the language engine's refineAltMany.
 
         Args:
             tags (list[bs4.element.Tag]): List of img tags to make associations for.
@@ -361,22 +727,525 @@ class AltText(ABC):
         Returns:
             list[dict]: List of associations. Must have keys "src" and "alt". If "withHash" is True, must also have key "hash".
         """
-        pass
+        uniqueTags, groups = tags, list(range(len(tags)))
+        if self.options["dedupe"]:
+            uniqueTags, groups = self.__planAssociations(tags)
+
+        try:
+            self.__prefetchDescs(uniqueTags)
+            self.__prefetchAlts(uniqueTags)
+            if self.options["multiThreaded"]:
+                uniques = self._genAltAssociationsMT(uniqueTags)
+            else:
+                uniques = self._genAltAssociationsST(uniqueTags)
+        finally:
+            self.prefetchedDescs = {}
+            self.prefetchedChars = {}
+            self.prefetchedAlts = {}
+
+        return self.__fanOutAssociations(tags, groups, uniques)
+
+    def __prefetchDescs(self, tags: list[bs4.element.Tag]) -> None:
+        # feeds the description engine "descBatchSize" images at a time ahead of per-image generation
+        size = self.options["descBatchSize"]
+        if size <= 0:
+            return
+        cache = self.__getCache()
+        identity = self.descEngine.getIdentity()
+        pending = []
+        seen = set()
+        for tag in tags:
+            try:
+                src = self._getTagSrc(tag)
+                digest = self.imgStore.getDigest(src)
+            except Exception:
+                continue
+            if digest in seen:
+                continue
+            seen.add(digest)
+            if cache != None and cache.get(cache.makeKey("desc", digest, identity)):
+                continue
+            pending.append((digest, src))
+
+        for i in range(0, len(pending), size):
+            chunk = pending[i : i + size]
+            images = [(self.getImgData(src), src) for _, src in chunk]
+            descs = self.descEngine.genDescMany(images)
+            for (digest, _), desc in zip(chunk, descs):
+                if desc == None:
+                    continue
+                self.prefetchedDescs[(digest, identity)] = desc
+                if cache != None:
+                    cache.set(cache.makeKey("desc", digest, identity), "desc", desc)
+
+    def __prefetchAlts(self, tags: list[bs4.element.Tag]) -> None:
+        # gathers each image's inputs first so "refineBatchSize" images share one language model request
+        size = self.options["refineBatchSize"]
+        if size <= 0 or self.options["version"] == 1 or self.langEngine == None:
+            return
+        cache = self.__getCache()
+
+        def gather(tag: bs4.element.Tag) -> tuple[list, dict]:
+            src = self._getTagSrc(tag)
+            context = [None, None]
+            caption = None
+            if self.options["withContext"]:
+                context = self.getContext(tag)
+                caption = self.getCaption(tag)
+            parts = self.__altKeyParts(2, src, context, caption)
+            if cache != None and cache.get(cache.makeKey("alt", *parts)) != None:
+                return None
+            imgData = self.getImgData(src)
+            desc, chars = self.__gatherV2(imgData, src, context)
+            # kept so an image whose batch fails is only refined again, not described again
+            digest = getDigest(imgData)
+            self.prefetchedDescs[(digest, self.descEngine.getIdentity())] = desc
+            if self.ocrEngine != None:
+                self.prefetchedChars[(digest, self.ocrEngine.getIdentity())] = chars
+            item = {
+                "desc": desc,
+                "chars": chars,
+                "context": context,
+                "caption": caption,
+            }
+            return parts, item
+
+        def refine(chunk: list[tuple[list, dict]]) -> list[str]:
+            return self.langEngine.refineAltMany([item for _, item in chunk])
+
+        # failures are left for per-image generation to report
+        if self.options["multiThreaded"]:
+            scheduler = Scheduler(
+                self.options["maxWorkers"],
+                self.options["queueDepth"],
+                self.options["taskTimeout"],
+            )
+            gathered = scheduler.map(gather, tags, lambda tag, err: None)
+        else:
+            gathered = [self.__tryCall(gather, tag) for tag in tags]
+        gathered = [item for item in gathered if item != None]
+
+        chunks = [gathered[i : i + size] for i in range(0, len(gathered), size)]
+        if self.options["multiThreaded"]:
+            refined = scheduler.map(refine, chunks, lambda chunk, err: None)
+        else:
+            refined = [self.__tryCall(refine, chunk) for chunk in chunks]
+        for chunk, alts in zip(chunks, refined):
+            if alts == None:
+                continue
+            for (parts, _), alt in zip(chunk, alts):
+                if alt == None:
+                    continue
+                self.prefetchedAlts[json.dumps(parts)] = alt
+                if cache != None:
+                    cache.set(cache.makeKey("alt", *parts), "alt", alt)
+
+    def __tryCall(self, fn: typing.Callable, item) -> typing.Any:
+        try:
+            return fn(item)
+        except Exception:
+            return None
+
+    def __fanOutAssociations(
+        self, tags: list[bs4.element.Tag], groups: list[int], uniques: list[dict]
+    ) -> list[dict]:
+        associations = []
+        for tag, group in zip(tags, groups):
+            association = dict(uniques[group])
+            association["src"] = self.__getAssociationSrc(tag)
+            associations.append(association)
+        return associations
+
+    # ASYNC GENERATIVE METHODS
+    async def __cachedAsync(self, kind: str, parts: list, generate: typing.Callable):
+        cache = self.__getCache()
+        if cache == None:
+            return await generate()
+        key = cache.makeKey(kind, *parts)
+        result = cache.get(key)
+        if result == None:
+            result = await generate()
+            cache.set(key, kind, result)
+        return result
+
+    async def genCharsAsync(self, imgData: bytes, src: str) -> str:
+        """Async variant of genChars.
+
+        Args:
+            imgData (bytes): Image data as bytes.
+            src (str): Source of the image.
+
+        Returns:
+            str: String of characters found in the image.
+        """
+        parts = [getDigest(imgData), self.ocrEngine.getIdentity()]
+        if tuple(parts) in self.prefetchedChars:
+            return self.prefetchedChars[tuple(parts)]
+        return await self.__cachedAsync(
+            "chars", parts, lambda: self.ocrEngine.genCharsAsync(imgData, src)
+        )
+
+    async def genDescAsync(self, imgData: bytes, src: str, context: str = None) -> str:
+        """Async variant of genDesc.
+
+        Args:
+            imgData (bytes): Image data as bytes.
+            src (str): Source of the image.
+            context (str, optional): Context for an image. See getContext for more information. Defaults to None.
+
+        Returns:
+            str: Description of the image.
+        """
+        parts = [getDigest(imgData), self.descEngine.getIdentity()]
+        if tuple(parts) in self.prefetchedDescs:
+            return self.prefetchedDescs[tuple(parts)]
+        return await self.__cachedAsync(
+            "desc", parts, lambda: self.descEngine.genDescAsync(imgData, src, context)
+        )
+
+    async def genAltTextAsync(self, src: str, tag: bs4.element.Tag = None) -> str:
+        """Async variant of genAltText. The description and characters are always generated concurrently.
+
+        Args:
+            src (str): Source of the image.
+            tag (bs4.element.Tag, optional): The img tag to take context from. Defaults to None, which uses the tag found by getImg.
+
+        Returns:
+            str: Generated alt-text for the image.
+        """
+        version = 1 if self.options["version"] == 1 else 2
+        if version == 2 and self.langEngine == None:
+            raise Exception("To use version 2, you must have a langEngine set.")
+
+        imgdata = await asyncio.to_thread(self.getImgData, src)
+        context = None if version == 1 else [None, None]
+        caption = None
+        if self.options["withContext"]:
+            tag = tag if tag != None else self.getImg(src)
+            context = self.getContext(tag)
+            if version == 2:
+                caption = self.getCaption(tag)
+
+        async def describe() -> str:
+            desc = await self.genDescAsync(imgdata, src, context)
+            if version == 1 and self.langEngine != None:
+                desc = await self.langEngine.refineDescAsync(desc)
+            return desc
+
+        async def recognize() -> str:
+            if self.ocrEngine == None:
+                return None if version == 1 else ""
+            chars = await self.genCharsAsync(imgdata, src)
+            if version == 2:
+                return chars.strip()
+            if self.langEngine != None:
+                chars = await self.langEngine.refineOCRAsync(chars)
+            return chars
+
+        async def generate() -> str:
+            desc, chars = await asyncio.gather(describe(), recognize())
+            if version == 2:
+                return await self.langEngine.refineAltAsync(
+                    desc, chars, context, caption
+                )
+            alt = f"IMAGE CAPTION: {desc}"
+            if chars != None:
+                alt = f"{alt}\nTEXT IN IMAGE: {chars}"
+            return alt
+
+        parts = self.__altKeyParts(version, src, context, caption)
+        prefetched = self.prefetchedAlts.get(json.dumps(parts))
+        if prefetched != None:
+            return prefetched
+        return await self.__cachedAsync("alt", parts, generate)
+
+    async def genAssociationAsync(self, tag: bs4.element.Tag) -> dict:
+        """Async variant of genAssociation.
+
+        Args:
+            tag (bs4.element.Tag): Image tag to make an association for.
+
+        Returns:
+            dict: The association. See genAssociation for more information.
+        """
+        src = self._getTagSrc(tag)
+        alt = await self.genAltTextAsync(src, tag)
+        association = {"src": src, "alt": alt}
+        if self.options["withHash"]:
+            association["hash"] = await asyncio.to_thread(self.imgStore.getDigest, src)
+        return association
+
+    async def genAltAssociationsAsync(
+        self,
+        tags: list[bs4.element.Tag],
+    ) -> list[dict]:
+        """Async variant of genAltAssociations.
+        At most "asyncConcurrency" images are generated at once, each limited to "taskTimeout" seconds.
+
+        Args:
+            tags (list[bs4.element.Tag]): List of img tags to make associations for.
+
+        Returns:
+            list[dict]: List of associations in the same order as tags. See _genAltAssociationsMT for more information.
+        """
+        uniqueTags, groups = tags, list(range(len(tags)))
+        if self.options["dedupe"]:
+            uniqueTags, groups = await asyncio.to_thread(self.__planAssociations, tags)
+
+        semaphore = asyncio.Semaphore(self.options["asyncConcurrency"])
+        timeout = self.options["taskTimeout"]
+
+        async def run(tag: bs4.element.Tag) -> dict:
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(
+                        self.genAssociationAsync(tag), timeout
+                    )
+                except asyncio.TimeoutError:
+                    err = TimeoutError(f"task timed out after {timeout} seconds")
+                    return self.__failedAssociation(tag, err)
+                except Exception as err:
+                    return self.__failedAssociation(tag, err)
+
+        # the language engine's async client is kept for this run and closed after it
+        if self.langEngine != None:
+            await self.langEngine.openAsync()
+        try:
+            await asyncio.to_thread(self.__prefetchDescs, uniqueTags)
+            await asyncio.to_thread(self.__prefetchAlts, uniqueTags)
+            uniques = await asyncio.gather(*[run(tag) for tag in uniqueTags])
+        finally:
+            self.prefetchedDescs = {}
+            self.prefetchedChars = {}
+            self.prefetchedAlts = {}
+            if self.langEngine != None:
+                await self.langEngine.closeAsync()
+        return self.__fanOutAssociations(tags, groups, uniques)
 
 
 ### HELPER METHODS
-def getSoup(content: str) -> bs4.BeautifulSoup:
+def isCaption(tag: bs4.element.Tag) -> bool:
+    if tag.name in ("figcaption", "caption"):
+        return True
+    classes = tag.attrs.get("class") or []
+    if isinstance(classes, str):
+        classes = classes.split()
+    return any("caption" in c.lower() for c in classes)
+
+
+def analyzeDocument(root: bs4.element.Tag) -> dict[int, tuple]:
+    """Finds the context and caption of every img tag in a document with one traversal.
+    Context matches walking previous_element and next_element from the img tag until an element with text is found, without repeating that walk for every image.
+
+    Args:
+        root (bs4.element.Tag): The parsed document.
+
+    Returns:
+        dict[int, tuple]: Maps id() of each img tag to (tag, context, caption). See getContext and getCaption in AltText for more information.
+    """
+    table = {}
+    texts = {}
+
+    def textOf(tag: bs4.element.Tag) -> str:
+        if id(tag) not in texts:
+            texts[id(tag)] = tag.text.strip()
+        return texts[id(tag)]
+
+    # each frame is [tag, position, imgs without a caption, direct child captions, imgs within]
+    frames = []
+    iterators = [iter(root.contents)]
+    position = 0
+    lastText = None
+    lastTextPosition = -1
+    pending = []
+
+    while len(iterators) > 0:
+        node = next(iterators[-1], None)
+        if node == None:
+            iterators.pop()
+            if len(frames) > 0 and len(frames) == len(iterators):
+                tag, _, imgs, captions, count = frames.pop()
+                parent = frames[-1] if len(frames) > 0 else None
+                if parent != None:
+                    parent[4] += count
+                owns = tag.name not in ("body", "html")
+                if len(captions) > 0 and owns:
+                    # the nearest element with a caption decides, and only captions an img it holds alone
+                    if len(imgs) == 1 and count == 1:
+                        caption = textOf(captions[0])
+                        table[id(imgs[0])][2] = caption if caption != "" else None
+                elif parent != None:
+                    parent[2].extend(imgs)
+            continue
+        position += 1
+
+        if isinstance(node, bs4.element.Tag):
+            if len(frames) > 0 and isCaption(node):
+                frames[-1][3].append(node)
+            if node.name == "img":
+                context = [None, None]
+                if len(node.contents) > 0 and textOf(node) != "":
+                    context = [textOf(node), textOf(node)]
+                else:
+                    # walking back reaches the nearest text unless an enclosing tag comes first
+                    context[0] = lastText
+                    for frame in reversed(frames):
+                        if lastTextPosition > frame[1]:
+                            break
+                        if textOf(frame[0]) != "":
+                            context[0] = textOf(frame[0])
+                            break
+                    pending.append((node, position))
+                table[id(node)] = [node, context, None]
+                if len(frames) > 0:
+                    frames[-1][2].append(node)
+                    frames[-1][4] += 1
+            frames.append([node, position, [], [], 0])
+            iterators.append(iter(node.contents))
+            continue
+
+        text = node.text.strip()
+        if text == "":
+            continue
+        for img, imgPosition in pending:
+            # the first element after the img with text is the outermost tag opened since that holds this string
+            after = text
+            for frame in frames:
+                if frame[1] > imgPosition:
+                    after = textOf(frame[0])
+                    break
+            table[id(img)][1][1] = after
+        pending = []
+        lastText = text
+        lastTextPosition = position
+
+    return {key: tuple(entry) for key, entry in table.items()}
+
+
+def getSoup(
+    content: str, parser: str = "html.parser", parseOnly: bs4.SoupStrainer = None
+) -> bs4.BeautifulSoup:
     try:
-        return bs4.BeautifulSoup(content, "html.parser")
+        return bs4.BeautifulSoup(content, parser, parse_only=parseOnly)
     except Exception as htmlErr:
         try:
-            return bs4.BeautifulSoup(content, features="xml")
+            return bs4.BeautifulSoup(content, features="xml", parse_only=parseOnly)
         except Exception as xmlErr:
             raise Exception(
                 f"Failed to parse the document as HTML: {htmlErr}\nFailed to parse the document as XML: {xmlErr}"
             )
 
 
+def findImgSpans(
+    source: bytes, tags: list[bs4.element.Tag], encoding: str = None
+) -> list[dict]:
+    """Finds where each img tag of a parsed document is in the document's original bytes, so "splice" exports can patch them without reading the document again.
+
+    Args:
+        source (bytes): The document the tags were parsed from.
+        tags (list[bs4.element.Tag]): All img tags of the parsed document, in document order.
+        encoding (str, optional): Encoding of source. Defaults to None, which sniffs it.
+
+    Returns:
+        list[dict]: Records with keys "tag", "start" and "end" (byte offsets of the tag in source, end exclusive), "src" and "alt", in document order. None if the imgs found in source do not match tags.
+    """
+    records = list(iterImgs(io.BytesIO(source), contextSize=0, encoding=encoding))
+    if len(records) != len(tags):
+        return None
+    spans = []
+    for record, tag in zip(records, tags):
+        if record["src"] != tag.attrs.get("src"):
+            return None
+        spans.append(
+            {
+                "tag": tag,
+                "start": record["start"],
+                "end": record["end"],
+                "src": record["src"],
+                "alt": record["alt"],
+            }
+        )
+    return spans
+
+
+def spliceAlts(
+    source: bytes,
+    spans: list[dict],
+    tags: list[bs4.element.Tag],
+    encoding: str = None,
+) -> tuple[bytes, list[dict]]:
+    """Writes the alt attributes of a document's img tags into its original bytes, leaving every other byte as it was.
+
+    Args:
+        source (bytes): The document the tags were parsed from.
+        spans (list[dict]): Where the tags are in source, as returned by findImgSpans.
+        tags (list[bs4.element.Tag]): All img tags of the parsed document, in document order.
+        encoding (str, optional): Encoding of source. Defaults to None, which sniffs it.
+
+    Returns:
+        tuple[bytes, list[dict]]: The patched document, and where the tags are in it.
+    """
+    if len(spans) != len(tags) or any(
+        span["tag"] is not tag for span, tag in zip(spans, tags)
+    ):
+        raise Exception(
+            "img tags were added to or removed from the document, which a 'splice' export cannot write. Use exportMode 'prettify' instead"
+        )
+    if encoding == None:
+        encoding = sniffEncoding(source[:4096])
+    parts = []
+    last = 0
+    shift = 0
+    patched = []
+    for span, tag in zip(spans, tags):
+        if tag.attrs.get("src") != span["src"]:
+            raise Exception(
+                f"the src of img '{span['src']}' was changed, which a 'splice' export cannot write. Use exportMode 'prettify' instead"
+            )
+        start, end = span["start"], span["end"]
+        alt = tag.attrs.get("alt")
+        # spans of the patched document move by the bytes added or removed before them
+        span = dict(span, start=start + shift, end=end + shift)
+        if alt != None and alt != span["alt"]:
+            raw = setAttr(source[start:end], "alt", alt, encoding)
+            parts.append(source[last:start])
+            parts.append(raw)
+            last = end
+            shift += len(raw) - (end - start)
+            span["end"] = span["start"] + len(raw)
+            span["alt"] = alt
+        patched.append(span)
+    parts.append(source[last:])
+    return b"".join(parts), patched
+
+
+def getZipHtml(archive: zipfile.ZipFile) -> str:
+    """Finds the book in a zip archive of an HTML book, such as Project Gutenberg's pg{id}-h.zip.
+
+    Args:
+        archive (zipfile.ZipFile): The opened archive.
+
+    Returns:
+        str: Name of the largest HTML member.
+    """
+    members = [
+        info
+        for info in archive.infolist()
+        if info.filename.lower().endswith((".html", ".htm", ".xhtml"))
+    ]
+    if len(members) == 0:
+        raise Exception(f"no HTML file found in '{archive.filename}'")
+    return max(members, key=lambda info: info.file_size).filename
+
+
+def checkExportMode(mode: str) -> str:
+    if mode not in ("prettify", "splice"):
+        raise Exception(
+            f"{mode} is not a valid exportMode. Please choose from ['prettify', 'splice']"
+        )
+    return mode
+
+
 ### IMPLEMENTATIONS
 class AltTextHTML(AltText):
     def __init__(
@@ -386,37 +1255,19 @@ class AltTextHTML(AltText):
         langEngine: LangEngine = None,
         options: dict = {},
     ) -> None:
-        self.data = None
+        super().__init__(descEngine, ocrEngine, langEngine, options)
         self.filename = None
         self.filedir = None
+        self.source = None
+        self.spans = None
+        self.archive = None
+        self.member = None
 
-        self.descEngine = descEngine
-        self.ocrEngine = ocrEngine
-        self.langEngine = langEngine
-
-        self.options = DEFOPTIONS
-        for key in dict.keys(options):
-            self.options[key] = options[key]
+        self.imgIndex = None
+        self.imgIndexLock = Lock()
 
         return None
 
-    def setDescEngine(self, descEngine: DescEngine) -> bool:
-        self.descEngine = descEngine
-        return True
-
-    def setOCREngine(self, ocrEngine: OCREngine) -> bool:
-        self.descEngine = ocrEngine
-        return True
-
-    def setLangEngine(self, langEngine: LangEngine) -> bool:
-        self.descEngine = langEngine
-        return True
-
-    def setOptions(self, options: dict) -> bool:
-        for key in dict.keys(options):
-            self.options[key] = options[key]
-        return True
-
     def checkData(self) -> bool:
         if not hasattr(self, "data") or self.data == None:
             raise Exception("no data set. please use .parse or .parseFile")
@@ -424,55 +1275,142 @@ class AltTextHTML(AltText):
 
     # PARSING METHODS
     def parse(self, html: str) -> bs4.BeautifulSoup:
-        soup = getSoup(html)
+        return self.__parse(html, None)
+
+    def __parse(self, html: str, raw: bytes) -> bs4.BeautifulSoup:
+        soup = getSoup(html, self.options["parser"])
         self.data = soup
+        self.source = None
+        self.spans = None
+        if checkExportMode(self.options["exportMode"]) == "splice":
+            # only "splice" exports need the original bytes, and where its img tags are in them
+            self.source = raw if raw != None else html.encode("utf-8")
+            self.spans = findImgSpans(self.source, soup.find_all("img"), "utf-8")
+        self.imgIndex = None
+        self.analyses = {}
+        self.imgStore = ImageStore(self.__readImgFile, self.options["imgCacheSize"])
         return soup
 
     def parseFile(self, filepath: str) -> bs4.BeautifulSoup:
-        with open(filepath, encoding="utf8") as html:
-            self.filepath = filepath.replace("\\", "/")
-            l = self.filepath.split("/")
+        with self.__openFile(filepath) as stream:
+            if checkExportMode(self.options["exportMode"]) != "splice":
+                return self.__parse(
+                    io.TextIOWrapper(stream, encoding="utf8").read(), None
+                )
+            # the file's bytes are kept as read, text mode would turn its CRLF line endings into LF
+            raw = stream.read()
+            html = io.TextIOWrapper(io.BytesIO(raw), encoding="utf8").read()
+            return self.__parse(html, raw)
+
+    def close(self) -> bool:
+        if self.archive != None:
+            self.archive.close()
+            self.archive = None
+        return super().close()
+
+    def __openFile(self, filepath: str) -> typing.BinaryIO:
+        # images of a zipped book are read from the archive, so it stays open until the next file
+        if self.archive != None:
+            self.archive.close()
+            self.archive = None
+            self.member = None
+        self.filepath = filepath.replace("\\", "/")
+        if self.filepath.lower().endswith(".zip"):
+            self.archive = zipfile.ZipFile(filepath)
+            self.member = getZipHtml(self.archive)
+            l = self.member.split("/")
             self.filename = l.pop()
-            self.filedir = "/".join(l) + "/"
-            return self.parse(html)
+            self.filedir = "".join(f"{part}/" for part in l)
+            return self.archive.open(self.member)
+        l = self.filepath.split("/")
+        self.filename = l.pop()
+        self.filedir = "/".join(l) + "/"
+        return open(filepath, "rb")
 
     def getAllImgs(self) -> typing.List[bs4.element.Tag]:
         self.checkData()
         imgs = self.data.find_all("img")
         return imgs
 
-    def getNoAltImgs(self) -> typing.List[bs4.element.Tag]:
-        imgs = self.getAllImgs()
-        noalt = []
-        for img in imgs:
-            if not "alt" in img.attrs.keys() or img.attrs["alt"].strip() == "":
-                noalt.append(img)
-        return noalt
+    def __buildImgIndex(self) -> dict[str, list[bs4.element.Tag]]:
+        index = {}
+        for img in self.data.find_all("img"):
+            if "src" in img.attrs:
+                index.setdefault(img.attrs["src"], []).append(img)
+        self.imgIndex = index
+        return index
 
-    def getImg(self, src: str) -> bs4.element.Tag:
+    def __findImgs(self, src: str) -> list[bs4.element.Tag]:
         self.checkData()
-        img = self.data.find("img", src=src)
-        return img
+        with self.imgIndexLock:
+            fresh = self.imgIndex == None
+            if fresh:
+                self.__buildImgIndex()
+            imgs = self.imgIndex.get(src, [])
+            # the soup is public and may be edited directly (tags added, detached, or given another src),
+            # so a miss or a stale entry rebuilds the index, unless it was just built
+            stale = len(imgs) == 0 or any(
+                img.parent == None or img.attrs.get("src") != src for img in imgs
+            )
+            if stale and not fresh:
+                imgs = self.__buildImgIndex().get(src, [])
+            return imgs
+
+    def getImg(self, src: str) -> bs4.element.Tag:
+        imgs = self.__findImgs(src)
+        if len(imgs) == 0:
+            return None
+        return imgs[0]
 
     def setAlt(self, src: str, text: str) -> bs4.element.Tag:
-        self.checkData()
-        img = self.data.find("img", src=src)
-        img.attrs["alt"] = text
-        return img
+        imgs = self.__findImgs(src)
+        if len(imgs) == 0:
+            raise Exception(f"unable to find image with src '{src}'")
+        for img in imgs:
+            img.attrs["alt"] = text
+        return imgs[0]
 
     def setAlts(self, associations: list[dict]) -> list[bs4.element.Tag]:
         self.checkData()
         tags = []
+        seen = set()
         for association in associations:
-            tags.append(self.setAlt(association["src"], association["alt"]))
+            if association["alt"] == None:
+                continue
+            for img in self.__findImgs(association["src"]):
+                img.attrs["alt"] = association["alt"]
+                if id(img) not in seen:
+                    seen.add(id(img))
+                    tags.append(img)
         return tags
 
     def export(self) -> str:
         self.checkData()
+        if checkExportMode(self.options["exportMode"]) == "splice":
+            return self.__splice().decode("utf-8")
         html = self.data.prettify()
         return html
 
+    def __splice(self) -> bytes:
+        if self.source == None:
+            raise Exception(
+                "exportMode 'splice' must be set before the document is parsed"
+            )
+        if self.spans == None:
+            raise Exception(
+                "the img tags of the document could not be found in its source, so it cannot be exported with exportMode 'splice'. Use 'prettify' instead"
+            )
+        spliced, _ = spliceAlts(
+            self.source, self.spans, self.data.find_all("img"), "utf-8"
+        )
+        return spliced
+
     def exportToFile(self, path: str) -> str:
+        if checkExportMode(self.options["exportMode"]) == "splice":
+            self.checkData()
+            with open(path, "wb") as file:
+                file.write(self.__splice())
+            return path
         html = self.export()
         with open(path, "w", encoding="utf-8") as file:
             file.write(html)
@@ -484,6 +1422,10 @@ class AltTextHTML(AltText):
             raise Exception(
                 "To use ingest, you must have an appropriate langEngine set."
             )
+        if self.archive != None:
+            with self.archive.open(self.member) as html:
+                self.langEngine.ingest(self.filename, html)
+            return True
         with open(self.filepath, "rb") as html:
             self.langEngine.ingest(self.filename, html)
         return True
@@ -497,189 +1439,399 @@ class AltTextHTML(AltText):
         return True
 
     def __getImgFilePath(self, src: str) -> str:
-        self.checkData()
+        self.__checkImgSource()
         path = f"{self.filedir}{src}"
         return path
 
-    def getImgData(self, src: str) -> bytes:
+    def __readImgFile(self, src: str) -> bytes:
+        if self.archive != None:
+            self.__checkImgSource()
+            name = posixpath.normpath(self.filedir + urllib.parse.unquote(src))
+            return self.archive.read(name)
         path = self.__getImgFilePath(src)
         with open(path, "rb") as bin:
             bin = bin.read()
             return bin
 
-    def getContext(self, tag: bs4.Tag) -> list[str]:
-        context = [None, None]
-        elem = tag
-        text = ""
-        try:
-            text = elem.text.strip()
-            while text == "":
-                elem = elem.previous_element
-                text = elem.text.strip()
-            context[0] = text
-        except:
-            context[0] = None
-        elem = tag
-        text = ""
-        try:
-            text = elem.text.strip()
-            while text == "":
-                elem = elem.next_element
-                text = elem.text.strip()
-            context[1] = text
-        except:
-            context[1] = None
-        return context
-
-    def genChars(self, imgData: bytes, src: str) -> str:
-        text = self.ocrEngine.genChars(imgData, src)
-        return text
-
-    def genDesc(self, imgData: bytes, src: str, context: str = None) -> str:
-        alt = self.descEngine.genDesc(imgData, src, context)
-        return alt
-
-    def genAltTextV1(self, src: str) -> str:
-        imgdata = self.getImgData(src)
-        context = None
-        if self.options["withContext"]:
-            context = self.getContext(self.getImg(src))
-        desc = self.genDesc(imgdata, src, context)
-        if self.langEngine != None:
-            chars = self.langEngine.refineDesc(desc)
-
-        alt = f"IMAGE CAPTION: {desc}"
-        if self.ocrEngine != None:
-            chars = self.genChars(imgdata, src)
-            if self.langEngine != None:
-                chars = self.langEngine.refineOCR(chars)
-            alt = f"{alt}\nTEXT IN IMAGE: {chars}"
-
-        return alt
-
-    def genAltTextV2(self, src: str) -> str:
-        imgdata = self.getImgData(src)
-        context = [None, None]
-        if self.options["withContext"]:
-            context = self.getContext(self.getImg(src))
-        desc = self.genDesc(imgdata, src, context)
-        chars = ""
-        if self.ocrEngine != None:
-            chars = self.genChars(imgdata, src).strip()
-
-        if self.langEngine == None:
-            raise Exception("To use version 2, you must have a langEngine set.")
-
-        return self.langEngine.refineAlt(desc, chars, context, None)
+    def getImgData(self, src: str) -> bytes:
+        self.__checkImgSource()
+        return self.imgStore.get(src)
 
-    def genAltText(self, src: str) -> str:
-        if self.options["version"] == 1:
-            return self.genAltTextV1(src)
-        return self.genAltTextV2(src)
+    def __checkImgSource(self) -> bool:
+        # streaming reads images without ever setting data
+        if self.imgStore == None:
+            raise Exception("no data set. please use .parse, .parseFile or .streamImgs")
+        return True
 
-    def genAssociation(
-        self,
-        tag: bs4.element.Tag,
-    ) -> dict:
-        src = tag.attrs["src"]
-        alt = self.genAltText(src)
-        association = {"src": src, "alt": alt}
-        if self.options["withHash"]:
-            data = self.getImgData(src)
-            association["hash"] = hash(data)
-        return association
+    # STREAMING METHODS
+    def streamImgs(self, filepath: str) -> typing.Iterator[dict]:
+        """Reads an HTML file incrementally and yields its img tags in document order, without parsing it into a soup.
+        Meant for books too large to hold as a tree. Image sources resolve against the file's directory as with parseFile.
 
-    def _genAltAssociationsST(self, tags: list[bs4.element.Tag]) -> list[dict]:
-        associations = []
-        for tag in tags:
-            associations.append(self.genAssociation(tag))
-        return associations
+        Args:
+            filepath (str): Path to the HTML file, or to a zip archive holding it and its images.
 
-    def _genAltAssociationsMT(
-        self,
-        tags: list[bs4.element.Tag],
-    ) -> list[dict]:
-        associations = []
+        Returns:
+            typing.Iterator[dict]: Records as yielded by htmlstream.iterImgs, with keys "src", "alt", "attrs", "start", "end" and "context".
+        """
+        with self.__openFile(filepath) as html:
+            self.imgStore = ImageStore(self.__readImgFile, self.options["imgCacheSize"])
+            yield from iterImgs(html)
 
-        def genAppend(tag):
-            associations.append(self.genAssociation(tag))
+    def genAltAssociationsStream(self, filepath: str) -> typing.Iterator[dict]:
+        """Generates associations for the img tags without alt-text in an HTML file while it is being read.
+        Associations are yielded in document order as soon as they are ready, so memory use does not grow with the size of the file.
+        Context is the text around each img in the file rather than its nearest elements, and captions are not detected.
+        If "dedupe" is True, imgs sharing a src are generated once, using the context of the first.
+        Runs on the bounded worker pool if "multiThreaded" is True, in which case failures are reported like in genAltAssociations.
 
-        threads: list[Thread] = []
-        for tag in tags:
-            thread = Thread(
-                target=genAppend,
-                args=(tag,),
-            )
-            thread.start()
-            threads.append(thread)
-        for thread in threads:
-            thread.join()
-        return associations
+        Args:
+            filepath (str): Path to the HTML file.
 
-    def genAltAssociations(
-        self,
-        tags: list[bs4.element.Tag],
-    ) -> list[dict]:
-        if self.options["multiThreaded"]:
-            return self._genAltAssociationsMT(tags)
-        return self._genAltAssociationsST(tags)
+        Returns:
+            typing.Iterator[dict]: Associations. Have keys "src" and "alt". If "withHash" is True, also have key "hash".
+        """
+        records = (
+            record
+            for record in self.streamImgs(filepath)
+            if record["src"] != None
+            and (record["alt"] == None or record["alt"].strip() == "")
+        )
+        memo = {}
+        memoLock = Lock()
+
+        def generate(record: dict) -> str:
+            context = record["context"] if self.options["withContext"] else None
+            if not self.options["dedupe"]:
+                return self._genAltTextWith(record["src"], context)
+            with memoLock:
+                owner = record["src"] not in memo
+                if owner:
+                    memo[record["src"]] = Future()
+                future = memo[record["src"]]
+            if owner:
+                try:
+                    future.set_result(self._genAltTextWith(record["src"], context))
+                except Exception as err:
+                    future.set_exception(err)
+            return future.result()
+
+        def associate(record: dict) -> dict:
+            association = {"src": record["src"], "alt": generate(record)}
+            if self.options["withHash"]:
+                association["hash"] = self.imgStore.getDigest(record["src"])
+            return association
+
+        if not self.options["multiThreaded"]:
+            for record in records:
+                yield associate(record)
+            return
+
+        scheduler = Scheduler(
+            self.options["maxWorkers"],
+            self.options["queueDepth"],
+            self.options["taskTimeout"],
+        )
+        yield from scheduler.imap(
+            associate,
+            records,
+            lambda record, err: {"src": record["src"], "alt": None, "error": str(err)},
+        )
 
 
 class AltTextEPUB(AltText):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        descEngine: DescEngine = None,
+        ocrEngine: OCREngine = None,
+        langEngine: LangEngine = None,
+        options: dict = {},
+    ) -> None:
+        super().__init__(descEngine, ocrEngine, langEngine, options)
+        self.filepath = None
+        self.filename = None
+        self.sourcePath = None
+        self.__resetSession()
         return None
 
+    def __resetSession(self) -> None:
+        # documents are parsed once per session and only re-serialized by export
+        self.docs = None
+        self.soups = {}
+        self.spans = {}
+        self.dirty = set()
+        self.changed = set()
+        self.imgIndex = None
+        self.analyses = {}
+        self.scans = {}
+        self.scanTags = {}
+        self.srcDocs = {}
+        self.hrefIndex = {}
+        self.docImgs = {}
+        self.tagDocs = {}
+        self.sessionLock = Lock()
+        self.imgStore = ImageStore(self.__readImgItem, self.options["imgCacheSize"])
+
     def checkData(self) -> bool:
-        if not hasattr(self, "data"):
+        if not hasattr(self, "data") or self.data == None:
             raise Exception("no data set. please use .parse or .parseFile")
         return True
 
+    # PARSING METHODS
     def parse(self, epub: epub.EpubBook) -> epub.EpubBook:
         self.data = epub
+        self.sourcePath = None
+        self.__resetSession()
         return self.data
 
+    def close(self) -> bool:
+        # only books opened by parseFile are closed, a book given to parse belongs to the caller
+        if isinstance(self.data, LazyEpub) and self.sourcePath != None:
+            self.data.close()
+            self.data = None
+        return super().close()
+
     def parseFile(self, filepath: str) -> epub.EpubBook:
-        book = epub.read_epub(filepath, {"ignore_ncx": True})
-        self.data = book
-        return book
+        if isinstance(self.data, LazyEpub) and self.sourcePath != None:
+            self.data.close()
+        load = self.options["epubLoad"]
+        if load == "eager":
+            book = epub.read_epub(filepath, {"ignore_ncx": True})
+        elif load in ("lazy", "mmap"):
+            book = LazyEpub(filepath, load == "mmap")
+        else:
+            raise Exception(
+                f"{load} is not a valid epubLoad. Please choose from ['eager', 'lazy', 'mmap']"
+            )
+        self.filepath = filepath.replace("\\", "/")
+        self.filename = self.filepath.split("/")[-1]
+        self.parse(book)
+        # the archive "splice" exports copy unchanged members from
+        self.sourcePath = filepath
+        return self.data
+
+    def __getDocs(self) -> dict[str, epub.EpubItem]:
+        self.checkData()
+        if self.docs == None:
+            self.docs = {}
+            for doc in self.data.get_items_of_type(ebooklib.ITEM_DOCUMENT):
+                self.docs[doc.file_name] = doc
+        return self.docs
+
+    def __getDocSoup(self, name: str) -> bs4.BeautifulSoup:
+        if name not in self.soups:
+            doc = self.__getDocs()[name]
+            soup = getSoup(doc.get_content(), self.options["parser"])
+            if checkExportMode(self.options["exportMode"]) == "splice":
+                # the raw item content, as the soup was built from ebooklib's rebuilt copy of it
+                self.spans[name] = findImgSpans(doc.content, soup.find_all("img"))
+            self.soups[name] = soup
+        return self.soups[name]
+
+    def __getDocScan(self, name: str) -> list[bs4.element.Tag]:
+        # builds only the img tags of a document, standing in for the full tags until those are needed
+        if name not in self.scans:
+            content = self.__getDocs()[name].get_content()
+            strainer = bs4.SoupStrainer("img")
+            imgs = getSoup(content, self.options["parser"], strainer).find_all("img")
+            for i, img in enumerate(imgs):
+                self.tagDocs[id(img)] = name
+                self.scanTags[id(img)] = (name, i, img)
+            self.scans[name] = imgs
+        return self.scans[name]
+
+    def __resolveHref(self, doc: str, src: str) -> str:
+        # img srcs are relative to their document, manifest hrefs are relative to the package
+        src = urllib.parse.unquote(src.split("#")[0])
+        return posixpath.normpath(posixpath.join(posixpath.dirname(doc), src))
+
+    def __getImgIndex(self) -> dict[tuple[str, str], list[bs4.element.Tag]]:
+        with self.sessionLock:
+            if self.imgIndex == None:
+                index = {}
+                for name in self.__getDocs():
+                    # features="xml"
+                    imgs = self.__getDocSoup(name).find_all("img")
+                    self.docImgs[name] = imgs
+                    for img in imgs:
+                        self.tagDocs[id(img)] = name
+                        if not "src" in img.attrs:
+                            continue
+                        src = img.attrs["src"]
+                        if (name, src) not in index:
+                            index[(name, src)] = []
+                            self.srcDocs.setdefault(src, []).append(name)
+                        index[(name, src)].append(img)
+                        href = self.__resolveHref(name, src)
+                        self.hrefIndex.setdefault(href, []).append((name, img))
+                self.imgIndex = index
+            return self.imgIndex
+
+    def __findImgs(
+        self, src: str, doc: str = None
+    ) -> list[tuple[str, bs4.element.Tag]]:
+        index = self.__getImgIndex()
+        if doc == None and src in self.hrefIndex:
+            return list(self.hrefIndex[src])
+        names = [doc] if doc != None else self.srcDocs.get(src, [])
+        found = []
+        for name in names:
+            for img in index.get((name, src), []):
+                found.append((name, img))
+        return found
 
     def getAllImgs(self) -> typing.List[bs4.element.Tag]:
-        documents = self.data.get_items_of_type(ebooklib.ITEM_DOCUMENT)
         imgs = []
-        for docs in documents:
-            # features="xml"
-            soup = getSoup(docs.get_content())
-            imgsInDoc = soup.find_all("img")
-            for img in imgsInDoc:
-                imgs.append(img)
+        if self.options["imgScan"] and self.imgIndex == None:
+            with self.sessionLock:
+                for name in self.__getDocs():
+                    imgs.extend(self.__getDocScan(name))
+            return imgs
+        self.__getImgIndex()
+        for name in self.__getDocs():
+            imgs.extend(self.docImgs[name])
         return imgs
 
-    def getNoAltImgs(self) -> typing.List[bs4.element.Tag]:
-        imgs = self.getAllImgs()
-        noalt = []
-        for img in imgs:
-            if not "alt" in img.attrs.keys() or img.attrs["alt"].strip() == "":
-                noalt.append(img)
-        return noalt
+    def getImg(self, src: str, doc: str = None) -> bs4.element.Tag:
+        found = self.__findImgs(src, doc)
+        if len(found) == 0:
+            return None
+        return found[0][1]
+
+    def setAlt(self, src: str, text: str, doc: str = None) -> bs4.element.Tag:
+        found = self.__findImgs(src, doc)
+        if len(found) == 0:
+            raise Exception("unable to find image with src '{src}'".format(src=src))
+        for name, img in found:
+            img.attrs["alt"] = text
+            self.dirty.add(name)
+        return found[0][1]
 
-    def setAlt(self, src: str, text: str):
+    def setAlts(self, associations: list[dict]) -> list[bs4.element.Tag]:
         self.checkData()
-        documents = self.data.get_items_of_type(ebooklib.ITEM_DOCUMENT)
-        for doc in documents:
-            soup = getSoup(doc.get_content())
-            imgsInDoc = soup.find_all("img")
-            for img in imgsInDoc:
-                if img.attrs["src"] == src:
-                    img.attrs["alt"] = text
-                    newHtml = soup.prettify()
-                    doc.set_content(newHtml.encode("utf-8"))
-                    return
-        raise Exception("unable to find image with src '{src}'".format(src=src))
+        tags = []
+        seen = set()
+        for association in associations:
+            if association["alt"] == None:
+                continue
+            for name, img in self.__findImgs(
+                association["src"], association.get("doc")
+            ):
+                img.attrs["alt"] = association["alt"]
+                self.dirty.add(name)
+                if id(img) not in seen:
+                    seen.add(id(img))
+                    tags.append(img)
+        return tags
 
     def export(self) -> epub.EpubBook:
         self.checkData()
+        docs = self.__getDocs()
+        splice = checkExportMode(self.options["exportMode"]) == "splice"
+        for name in sorted(self.dirty):
+            if splice:
+                if name not in self.spans:
+                    raise Exception(
+                        f"'{name}' was read or exported without exportMode 'splice', so it cannot be exported with it"
+                    )
+                if self.spans[name] == None:
+                    raise Exception(
+                        f"the img tags of '{name}' could not be found in its source, so it cannot be exported with exportMode 'splice'. Use 'prettify' instead"
+                    )
+                spliced, self.spans[name] = spliceAlts(
+                    docs[name].content,
+                    self.spans[name],
+                    self.soups[name].find_all("img"),
+                )
+                docs[name].set_content(spliced)
+            else:
+                # the spans no longer match the re-serialized content
+                self.spans.pop(name, None)
+                newHtml = self.soups[name].prettify()
+                docs[name].set_content(newHtml.encode("utf-8"))
+            self.changed.add(name)
+        self.dirty.clear()
         return self.data
 
     def exportToFile(self, path: str) -> str:
-        epub.write_epub(path, self.export())
+        book = self.export()
+        if isinstance(book, LazyEpub):
+            # a lazy book can only be written by copying its archive
+            return writeEpub(book.source, path, book.getReplaced())
+        if self.options["exportMode"] == "splice" and self.sourcePath != None:
+            # unchanged members are copied from the original archive as they are
+            docs = self.__getDocs()
+            contents = {name: docs[name].content for name in self.changed}
+            return writeEpub(self.sourcePath, path, contents)
+        epub.write_epub(path, book)
         return path
+
+    # GENERATIVE METHODS
+    def ingest(self) -> bool:
+        if self.langEngine == None:
+            raise Exception(
+                "To use ingest, you must have an appropriate langEngine set."
+            )
+        if self.filepath == None:
+            raise Exception("To use ingest, the EPUB must be loaded with .parseFile")
+        with open(self.filepath, "rb") as book:
+            self.langEngine.ingest(self.filename, book)
+        return True
+
+    def degest(self) -> bool:
+        if self.langEngine == None:
+            raise Exception(
+                "To use degest, you must have an appropriate langEngine set."
+            )
+        self.langEngine.degest(self.filename)
+        return True
+
+    def genAssociation(self, tag: bs4.element.Tag) -> dict:
+        association = super().genAssociation(tag)
+        self.__releaseImg(association["src"])
+        return association
+
+    async def genAssociationAsync(self, tag: bs4.element.Tag) -> dict:
+        association = await super().genAssociationAsync(tag)
+        self.__releaseImg(association["src"])
+        return association
+
+    def __releaseImg(self, src: str) -> None:
+        # lazy books read images on demand, so their bytes are not held once the alt-text exists
+        if isinstance(self.data, LazyEpub):
+            self.imgStore.drop(src)
+
+    def _getTagSrc(self, tag: bs4.element.Tag) -> str:
+        if id(tag) not in self.tagDocs:
+            self.__getImgIndex()
+        if id(tag) not in self.tagDocs:
+            raise Exception("img tag is not part of the current EPUB")
+        if not "src" in tag.attrs:
+            raise Exception("img tag has no src attribute")
+        return self.__resolveHref(self.tagDocs[id(tag)], tag.attrs["src"])
+
+    def _resolveTag(self, tag: bs4.element.Tag) -> bs4.element.Tag:
+        scanned = self.scanTags.get(id(tag))
+        if scanned == None or scanned[2] is not tag:
+            return tag
+        name, i, _ = scanned
+        self.__getImgIndex()
+        imgs = self.docImgs.get(name, [])
+        # both parses see a document's imgs in the same order
+        if i < len(imgs) and imgs[i].attrs.get("src") == tag.attrs.get("src"):
+            return imgs[i]
+        for img in imgs:
+            if img.attrs.get("src") == tag.attrs.get("src"):
+                return img
+        return tag
+
+    def __readImgItem(self, src: str) -> bytes:
+        self.checkData()
+        item = self.data.get_item_with_href(src)
+        if item == None:
+            raise Exception(f"unable to find image with href '{src}'")
+        return item.get_content()
+
+    def getImgData(self, src: str) -> bytes:
+        self.checkData()
+        return self.imgStore.get(src)
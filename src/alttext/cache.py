@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+
+# bump when the meaning of cached values changes so stale entries stop matching
+CACHE_VERSION = 1
+
+
+def getDigest(data: bytes) -> str:
+    """Gets the content digest used to identify image data across runs.
+
+    Args:
+        data (bytes): Image data as bytes.
+
+    Returns:
+        str: Hex SHA-256 digest of the data.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path: str, maxSize: int = 256 * 1024 * 1024) -> None:
+        """On-disk cache of generated descriptions, characters, and alt-text.
+
+        Args:
+            path (str): Path to the SQLite database file. Created if it does not exist.
+            maxSize (int, optional): Maximum total size of stored values in bytes. Least recently used entries are evicted past this. Defaults to 256 MiB.
+        """
+        self.path = path
+        self.maxSize = maxSize
+        self.lock = Lock()
+
+        folder = os.path.dirname(path)
+        if folder != "":
+            os.makedirs(folder, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                """CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL
+                )"""
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)"
+            )
+            self.connection.commit()
+            self.size = self.__totalSize()
+        return None
+
+    def __totalSize(self) -> int:
+        row = self.connection.execute("SELECT SUM(size) FROM results").fetchone()
+        return row[0] or 0
+
+    def makeKey(self, kind: str, *parts) -> str:
+        """Builds a cache key from a kind and the values that determine the result.
+
+        Args:
+            kind (str): Kind of result, e.g. "desc", "chars" or "alt".
+            *parts: JSON serializable values the result depends on, e.g. an image digest and engine identities.
+
+        Returns:
+            str: The cache key.
+        """
+        raw = json.dumps([CACHE_VERSION, kind, *parts], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Gets a cached value.
+
+        Args:
+            key (str): Key made with makeKey.
+
+        Returns:
+            The cached value, or None if there is no entry for key.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row == None:
+                return None
+            self.connection.execute(
+                "UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+            self.connection.commit()
+        return json.loads(row[0])
+
+    def set(self, key: str, kind: str, value) -> bool:
+        """Stores a value, evicting least recently used entries if the cache grows past maxSize.
+
+        Args:
+            key (str): Key made with makeKey.
+            kind (str): Kind of result, e.g. "desc", "chars" or "alt".
+            value: JSON serializable value to store.
+
+        Returns:
+            bool: True if successful.
+        """
+        raw = json.dumps(value)
+        size = len(raw.encode("utf-8"))
+        with self.lock:
+            old = self.connection.execute(
+                "SELECT size FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results (key, kind, value, size, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, raw, size, time.time()),
+            )
+            self.size += size - (old[0] if old != None else 0)
+            if self.size > self.maxSize:
+                self.__evict()
+            self.connection.commit()
+        return True
+
+    def __evict(self) -> None:
+        # other processes may share the file, so resync before deciding what to drop
+        self.size = self.__totalSize()
+        rows = self.connection.execute(
+            "SELECT key, size FROM results ORDER BY accessed ASC"
+        )
+        evicted = []
+        for key, size in rows:
+            if self.size <= self.maxSize:
+                break
+            evicted.append((key,))
+            self.size -= size
+        self.connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+    def clear(self) -> bool:
+        """Removes every entry from the cache.
+
+        Returns:
+            bool: True if successful.
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM results")
+            self.connection.commit()
+            self.size = 0
+        return True
+
+    def close(self) -> None:
+        """Closes the underlying database connection."""
+        with self.lock:
+            self.connection.close()
@@ -1,29 +1,123 @@
+import glob
 import os
 import shutil
 import subprocess
+import time
 import uuid
+from threading import Event, Lock
 
 from .descengine import DescEngine
+from .normalizer import ImageNormalizer
+
+# BLIP-Large captions 384x384 inputs
+BLIP_INPUT_SIZE = 384
+
 
 class BlipLocal(DescEngine):
-    def __init__(self, path: str) -> None:
+    def __init__(
+        self,
+        path: str,
+        batchSize: int = 8,
+        normalizer: ImageNormalizer = None,
+        batchWait: float = 0.05,
+    ) -> None:
+        """Description engine running BLIP through the image-captioning fork's inference.py.
+
+        Args:
+            path (str): Path to the image-captioning folder.
+            batchSize (int, optional): Number of images inference.py captions at once. Defaults to 8.
+            normalizer (ImageNormalizer, optional): Downscales images before they are written for inference.py. Defaults to None.
+            batchWait (float, optional): Seconds genDesc waits for calls from other threads, so they share one inference.py run and one checkpoint load. Defaults to 0.05.
+        """
         self.__setPath(path)
+        self.batchSize = batchSize
+        self.normalizer = normalizer
+        self.batchWait = batchWait
+        # genDesc calls waiting for the next run, each {"image", "done", "desc", "error"}
+        self.pending = []
+        self.pendingLock = Lock()
         return None
 
     def __setPath(self, path: str) -> str:
         self.path = path
         return self.path
 
-    def genDesc(self, imgData: bytes, src: str, context: str = None) -> str:
+    def __caption(self, images: list[tuple[bytes, str]], batchSize: int) -> dict:
+        # one inference.py run loads the checkpoint once for every image in the folder
         folderName = uuid.uuid4()
-        ext = src.split(".")[-1]
-        os.makedirs(f"{self.path}/{folderName}")
-        open(f"{self.path}/{folderName}/image.{ext}", "wb+").write(imgData)
-        subprocess.call(
-            f"py inference.py -i ./{folderName} --batch 1 --gpu 0",
-            cwd=f"{self.path}",
-        )
-        desc = open(f"{self.path}/{folderName}/0_captions.txt", "r").read()
-        shutil.rmtree(f"{self.path}/{folderName}")
-        desc = desc.split(",")
-        return desc[1]
\ No newline at end of file
+        folder = f"{self.path}/{folderName}"
+        os.makedirs(folder)
+        try:
+            for i, (imgData, src) in enumerate(images):
+                if self.normalizer != None:
+                    imgData, src = self.normalizer.normalize(
+                        imgData, src, BLIP_INPUT_SIZE
+                    )
+                ext = src.split(".")[-1]
+                open(f"{folder}/{i}.{ext}", "wb+").write(imgData)
+            code = subprocess.call(
+                f"py inference.py -i ./{folderName} --batch {batchSize} --gpu 0",
+                cwd=f"{self.path}",
+            )
+            # a failed run would leave every image without a caption, and retrying them one by one would fail the same way
+            if code != 0:
+                raise Exception(f"inference.py exited with status {code}")
+            captions = {}
+            for captionFile in glob.glob(f"{folder}/*_captions.txt"):
+                for line in open(captionFile, "r").read().splitlines():
+                    if "," not in line:
+                        continue
+                    fileName, desc = line.split(",", 1)
+                    captions[os.path.basename(fileName).split(".")[0]] = desc
+            return captions
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def getIdentity(self) -> str:
+        if self.normalizer != None:
+            return f"BlipLocal:{self.normalizer.getIdentity()}"
+        return "BlipLocal"
+
+    def genDesc(self, imgData: bytes, src: str, context: str = None) -> str:
+        request = {
+            "image": (imgData, src),
+            "done": Event(),
+            "desc": None,
+            "error": None,
+        }
+        with self.pendingLock:
+            self.pending.append(request)
+            leader = len(self.pending) == 1
+        if leader:
+            # the first caller runs inference.py for everything queued while it waited
+            time.sleep(self.batchWait)
+            with self.pendingLock:
+                batch = self.pending
+                self.pending = []
+            self.__runBatch(batch)
+        request["done"].wait()
+        if request["error"] != None:
+            # every caller in the run gets its own exception, rather than all raising the same object
+            raise Exception(str(request["error"])) from request["error"]
+        if request["desc"] == None:
+            raise Exception(f"BLIP produced no caption for {src}")
+        return request["desc"]
+
+    def __runBatch(self, batch: list[dict]) -> None:
+        try:
+            images = [request["image"] for request in batch]
+            captions = self.__caption(images, max(1, min(self.batchSize, len(images))))
+            for i, request in enumerate(batch):
+                request["desc"] = captions.get(str(i))
+        except Exception as err:
+            for request in batch:
+                request["error"] = err
+        finally:
+            for request in batch:
+                request["done"].set()
+
+    def genDescMany(self, images: list[tuple[bytes, str]]) -> list[str]:
+        if len(images) == 0:
+            return []
+        captions = self.__caption(images, max(1, min(self.batchSize, len(images))))
+        return [captions.get(str(i)) for i in range(len(images))]
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+import asyncio
 
 
 ### DESCENGINE CLASSES
@@ -16,3 +17,42 @@ class DescEngine(ABC):
             str: _description_
         """
         pass
+
+    def genDescMany(self, images: list[tuple[bytes, str]]) -> list[str]:
+        """Generates descriptions for many images at once. Engines that can batch requests override this.
+
+        Args:
+            images (list[tuple[bytes, str]]): Pairs of image data in bytes and source of image.
+
+        Returns:
+            list[str]: Descriptions in the same order as images. An entry is None if that image could not be described.
+        """
+        descs = []
+        for imgData, src in images:
+            try:
+                descs.append(self.genDesc(imgData, src))
+            except Exception:
+                descs.append(None)
+        return descs
+
+    async def genDescAsync(self, imgData: bytes, src: str, context: str = None) -> str:
+        """Async variant of genDesc. Runs genDesc in a worker thread unless the engine has a native async client.
+
+        Args:
+            imgData (bytes): Image data in bytes.
+            src (str): Source of image.
+            context (str, optional): Context of image. See getContext in alttext for more information. Defaults to None.
+
+        Returns:
+            str: Description of the image.
+        """
+        return await asyncio.to_thread(self.genDesc, imgData, src, context)
+
+    def getIdentity(self) -> str:
+        """Gets a string identifying the engine and the model it uses.
+        Used to key cached results, so it should change whenever the engine would produce different output.
+
+        Returns:
+            str: Identity of the description engine.
+        """
+        return type(self).__name__
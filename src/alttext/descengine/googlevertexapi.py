@@ -1,37 +1,89 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
 import vertexai
 from vertexai.vision_models import ImageTextModel, Image
 
 from .descengine import DescEngine
+from .normalizer import ImageNormalizer
+
+VERTEX_MODEL = "imagetext@001"
+
 
 class GoogleVertexAPI(DescEngine):
-    def __init__(self, project_id: str, location: str, gac_path: str) -> None:
+    def __init__(
+        self,
+        project_id: str,
+        location: str,
+        gac_path: str,
+        batchWorkers: int = 8,
+        normalizer: ImageNormalizer = None,
+    ) -> None:
         self.project_id = project_id
         self.location = location
         vertexai.init(project=self.project_id, location=self.location)
 
         self.gac_path = gac_path
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = self.gac_path
+
+        self.batchWorkers = batchWorkers
+        self.normalizer = normalizer
+        self.model = None
+        self.modelLock = Lock()
         return None
 
     def __setProject(self, project_id: str):
         self.project_id = project_id
         vertexai.init(project=self.project_id, location=self.location)
+        self.__resetModel()
 
     def __setLocation(self, location: str):
         self.location = location
         vertexai.init(project=self.project_id, location=self.location)
+        self.__resetModel()
 
     def __setGAC(self, gac_path: str):
         self.gac_path = gac_path
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = self.gac_path
+        self.__resetModel()
+
+    def __resetModel(self) -> None:
+        with self.modelLock:
+            self.model = None
+
+    def __getModel(self) -> ImageTextModel:
+        # resolved once and shared, the underlying prediction client is thread safe
+        with self.modelLock:
+            if self.model == None:
+                self.model = ImageTextModel.from_pretrained(VERTEX_MODEL)
+            return self.model
+
+    def getIdentity(self) -> str:
+        if self.normalizer != None:
+            return f"GoogleVertexAPI:{VERTEX_MODEL}:{self.normalizer.getIdentity()}"
+        return f"GoogleVertexAPI:{VERTEX_MODEL}"
 
     def genDesc(self, imgData: bytes, src: str, context: str = None) -> str:
-        model = ImageTextModel.from_pretrained("imagetext@001")
+        model = self.__getModel()
+        if self.normalizer != None:
+            imgData, src = self.normalizer.normalize(imgData, src)
         source_image = Image(imgData)
         captions = model.get_captions(
             image=source_image,
             number_of_results=1,
             language="en",
         )
-        return captions[0]
\ No newline at end of file
+        return captions[0]
+
+    def genDescMany(self, images: list[tuple[bytes, str]]) -> list[str]:
+        # the caption endpoint takes one image per call, so a batch is sent as concurrent calls
+        def describe(image: tuple[bytes, str]) -> str:
+            try:
+                return self.genDesc(image[0], image[1])
+            except Exception:
+                return None
+
+        self.__getModel()
+        with ThreadPoolExecutor(max_workers=self.batchWorkers) as executor:
+            return list(executor.map(describe, images))
@@ -0,0 +1,117 @@
+from collections import OrderedDict
+from io import BytesIO
+from threading import Lock
+
+from PIL import Image
+
+from ..cache import getDigest
+
+NORMALIZER_FORMATS = {"JPEG": "jpeg", "WEBP": "webp", "PNG": "png"}
+
+
+class ImageNormalizer:
+    def __init__(
+        self,
+        maxSide: int = 1024,
+        format: str = "JPEG",
+        quality: int = 85,
+        cacheSize: int = 64 * 1024 * 1024,
+    ) -> None:
+        """Shrinks images before they are sent to a description engine.
+        Images are downscaled to fit the model's input size, re-encoded, and stripped of metadata.
+
+        Args:
+            maxSide (int, optional): Longest side in pixels when the engine does not give its own input size. Defaults to 1024.
+            format (str, optional): Output format, one of "JPEG", "WEBP" or "PNG". Defaults to "JPEG".
+            quality (int, optional): Encoder quality for JPEG and WEBP. Defaults to 85.
+            cacheSize (int, optional): Memory budget in bytes for normalized images, kept by content digest. Defaults to 64 MiB.
+        """
+        if format not in NORMALIZER_FORMATS:
+            raise Exception(
+                f"{format} is not a valid format. Please choose from {list(NORMALIZER_FORMATS.keys())}"
+            )
+        self.maxSide = maxSide
+        self.format = format
+        self.quality = quality
+        self.cacheSize = cacheSize
+        self.size = 0
+        self.items: OrderedDict[tuple, tuple[bytes, str]] = OrderedDict()
+        self.lock = Lock()
+        return None
+
+    def getIdentity(self) -> str:
+        """Gets a string identifying the normalization settings. Engines add it to their own identity.
+
+        Returns:
+            str: Identity of the normalizer.
+        """
+        return f"ImageNormalizer:{self.maxSide}:{self.format}:{self.quality}"
+
+    def normalize(
+        self, imgData: bytes, src: str, maxSide: int = None
+    ) -> tuple[bytes, str]:
+        """Normalizes an image. The original is returned if normalizing would not make it smaller.
+
+        Args:
+            imgData (bytes): Image data in bytes.
+            src (str): Image source, used for its file extension.
+            maxSide (int, optional): Longest side in pixels the model uses. Defaults to None (the normalizer's maxSide).
+
+        Returns:
+            tuple[bytes, str]: Normalized image data and src with a matching file extension.
+        """
+        maxSide = maxSide if maxSide != None else self.maxSide
+        key = (getDigest(imgData), maxSide)
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                data, ext = self.items[key]
+                return self.__result(imgData, src, data, ext)
+
+        data, ext = self.__encode(imgData, maxSide)
+        size = len(data) if data != None else 0
+        with self.lock:
+            if key not in self.items and size <= self.cacheSize:
+                self.items[key] = (data, ext)
+                self.size += size
+                while self.size > self.cacheSize:
+                    _, (evicted, _) = self.items.popitem(last=False)
+                    self.size -= len(evicted) if evicted != None else 0
+        return self.__result(imgData, src, data, ext)
+
+    def __result(
+        self, imgData: bytes, src: str, data: bytes, ext: str
+    ) -> tuple[bytes, str]:
+        # None marks an image that is kept as is
+        if data == None:
+            return imgData, src
+        return data, f"{src.rsplit('.', 1)[0]}.{ext}"
+
+    def __encode(self, imgData: bytes, maxSide: int) -> tuple[bytes, str]:
+        try:
+            image = Image.open(BytesIO(imgData))
+            image.draft("RGB", (maxSide, maxSide))
+            image.load()
+        except Exception:
+            # leave anything Pillow cannot read for the engine to handle
+            return None, None
+
+        if self.format == "JPEG" or image.mode not in ("RGB", "RGBA", "L", "LA"):
+            if "A" in image.getbands() or "transparency" in image.info:
+                image = image.convert("RGBA")
+                background = Image.new("RGBA", image.size, "white")
+                image = Image.alpha_composite(background, image)
+            image = image.convert("RGB")
+        if max(image.size) > maxSide:
+            image.thumbnail((maxSide, maxSide), Image.LANCZOS)
+
+        buffer = BytesIO()
+        # a fresh save carries no EXIF, ICC or text chunks from the original
+        if self.format == "PNG":
+            image.save(buffer, format="PNG", optimize=True)
+        else:
+            image.save(buffer, format=self.format, quality=self.quality)
+        data = buffer.getvalue()
+        if len(data) >= len(imgData):
+            return None, None
+        return data, NORMALIZER_FORMATS[self.format]
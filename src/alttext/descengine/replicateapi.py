@@ -1,8 +1,10 @@
 import replicate
 import base64
 import os
+import time
 
 from .descengine import DescEngine
+from .normalizer import ImageNormalizer
 
 REPLICATE_MODELS = {
     "blip-2": "andreasjansson/blip-2:f677695e5e89f8b236e52ecd1d3f01beb44c34606419bcc19345e046d8f786f9",
@@ -16,11 +18,40 @@ REPLICATE_MODELS = {
     "image-captioning-with-visual-attention": "nohamoamary/image-captioning-with-visual-attention:9bb60a6baa58801aa7cd4c4fafc95fcf1531bf59b84962aff5a718f4d1f58986",
 }
 
+# longest image side each model's vision encoder works at, larger uploads are only resized again server side
+REPLICATE_INPUT_SIZES = {
+    "blip-2": 224,
+    "blip": 384,
+    "llava-13b": 336,
+    "img2prompt": 384,
+    "clip_prefix_caption": 224,
+    "clip-interrogator": 384,
+    "clip-caption-reward": 224,
+    "minigpt4": 224,
+}
+
 
 class ReplicateAPI(DescEngine):
-    def __init__(self, key: str, modelName: str = "blip") -> None:
+    def __init__(
+        self,
+        key: str,
+        modelName: str = "blip",
+        normalizer: ImageNormalizer = None,
+        pollInterval: float = 1.0,
+        maxInFlight: int = 32,
+        predictionTimeout: float = None,
+        reloadRetries: int = 3,
+        createFailures: int = 3,
+    ) -> None:
         self.__setKey(key)
         self.__setModel(modelName)
+        self.normalizer = normalizer
+        self.pollInterval = pollInterval
+        self.maxInFlight = maxInFlight
+        self.predictionTimeout = predictionTimeout
+        self.reloadRetries = reloadRetries
+        self.createFailures = createFailures
+        self.errors = {}
         return None
 
     def __getModel(self) -> str:
@@ -32,6 +63,7 @@ class ReplicateAPI(DescEngine):
                 f"{modelName} is not a valid model. Please choose from {list(REPLICATE_MODELS.keys())}"
             )
         self.model = REPLICATE_MODELS[modelName]
+        self.inputSize = REPLICATE_INPUT_SIZES.get(modelName)
         return self.model
 
     def __getKey(self) -> str:
@@ -42,9 +74,15 @@ class ReplicateAPI(DescEngine):
         os.environ["REPLICATE_API_TOKEN"] = key
         return self.key
 
-    def genDesc(self, imgData: bytes, src: str, context: str = None) -> str:
+    def getIdentity(self) -> str:
+        if self.normalizer != None:
+            return f"ReplicateAPI:{self.__getModel()}:{self.normalizer.getIdentity()}"
+        return f"ReplicateAPI:{self.__getModel()}"
+
+    def __getInput(self, imgData: bytes, src: str) -> dict:
+        if self.normalizer != None:
+            imgData, src = self.normalizer.normalize(imgData, src, self.inputSize)
         base64_utf8_str = base64.b64encode(imgData).decode("utf-8")
-        model = self.__getModel()
         ext = src.split(".")[-1]
         dataurl = f"data:image/{ext};base64,{base64_utf8_str}"
 
@@ -56,8 +94,112 @@ class ReplicateAPI(DescEngine):
             input["prompt"] = "What is this a picture of?"
         if self.model == REPLICATE_MODELS["minigpt4"]:
             input["prompt"] = "What is this a picture of?"
+        return input
+
+    def genDesc(self, imgData: bytes, src: str, context: str = None) -> str:
+        model = self.__getModel()
+        input = self.__getInput(imgData, src)
 
         output = replicate.run(model, input=input)
         if self.model == REPLICATE_MODELS["llava-13b"]:
             return "".join(output)
         return output
+
+    async def genDescAsync(self, imgData: bytes, src: str, context: str = None) -> str:
+        model = self.__getModel()
+        input = self.__getInput(imgData, src)
+
+        output = await replicate.async_run(model, input=input)
+        if hasattr(output, "__aiter__"):
+            return "".join([token async for token in output])
+        if self.model == REPLICATE_MODELS["llava-13b"]:
+            return "".join(output)
+        return output
+
+    def __getOutput(self, output) -> str:
+        # llava-13b streams tokens, which a finished prediction reports as a list
+        if isinstance(output, list):
+            return "".join(output)
+        return output
+
+    def getErrors(self) -> dict[int, str]:
+        """Gets why images of the last genDescMany call got no description.
+
+        Returns:
+            dict[int, str]: Error message by index in the images given to genDescMany.
+        """
+        return dict(self.errors)
+
+    def __cancel(self, prediction) -> None:
+        try:
+            prediction.cancel()
+        except Exception:
+            pass
+
+    def genDescMany(self, images: list[tuple[bytes, str]]) -> list[str]:
+        # predictions are created up front and polled together, so their queue times overlap
+        version = self.__getModel().split(":")[-1]
+        descs = [None] * len(images)
+        errors = {}
+        pending = {}
+        started = {}
+        reloadErrors = {}
+        failedCreates = 0
+        nextIndex = 0
+        try:
+            while nextIndex < len(images) or len(pending) > 0:
+                while nextIndex < len(images) and len(pending) < self.maxInFlight:
+                    try:
+                        input = self.__getInput(*images[nextIndex])
+                        pending[nextIndex] = replicate.predictions.create(
+                            version=version, input=input
+                        )
+                        started[nextIndex] = time.monotonic()
+                        failedCreates = 0
+                    except replicate.exceptions.ReplicateError as err:
+                        # the client reports every API error alike, so a bad token, no credit, or an unknown version
+                        # shows as create failing for image after image; the rest would fail the same way
+                        failedCreates += 1
+                        if failedCreates >= self.createFailures:
+                            raise
+                        errors[nextIndex] = f"create failed: {err}"
+                    except Exception as err:
+                        errors[nextIndex] = f"create failed: {err}"
+                    nextIndex += 1
+
+                for i, prediction in list(pending.items()):
+                    try:
+                        prediction.reload()
+                        reloadErrors.pop(i, None)
+                    except Exception as err:
+                        # polling errors are usually transient, the prediction keeps running meanwhile
+                        reloadErrors[i] = reloadErrors.get(i, 0) + 1
+                        if reloadErrors[i] > self.reloadRetries:
+                            errors[i] = f"reload failed: {err}"
+                            self.__cancel(pending.pop(i))
+                        continue
+                    if prediction.status == "succeeded":
+                        descs[i] = self.__getOutput(prediction.output)
+                        pending.pop(i)
+                    elif prediction.status in ("failed", "canceled"):
+                        errors[i] = (
+                            f"prediction {prediction.status}: {prediction.error}"
+                        )
+                        pending.pop(i)
+                    elif (
+                        self.predictionTimeout != None
+                        and time.monotonic() - started[i] > self.predictionTimeout
+                    ):
+                        errors[i] = (
+                            f"prediction timed out after {self.predictionTimeout} seconds"
+                        )
+                        self.__cancel(pending.pop(i))
+
+                if len(pending) > 0:
+                    time.sleep(self.pollInterval)
+        finally:
+            # predictions still running when failing fast are not left to bill
+            for prediction in pending.values():
+                self.__cancel(prediction)
+            self.errors = errors
+        return descs
@@ -0,0 +1,275 @@
+import os
+import posixpath
+import struct
+import time
+import typing
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+
+# layouts as in the ZIP specification (and zipfile)
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+CENTRAL_HEADER = struct.Struct("<4s4B4HL2L5H2L")
+END_RECORD = struct.Struct("<4s4H2LH")
+LOCAL_SIGNATURE = b"PK\x03\x04"
+CENTRAL_SIGNATURE = b"PK\x01\x02"
+END_SIGNATURE = b"PK\x05\x06"
+DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+
+DESCRIPTOR_FLAG = 0x08
+UTF8_FLAG = 0x800
+ZIP64_EXTRA = 0x0001
+ZIP32_LIMIT = 0xFFFFFFFF
+COPY_SIZE = 1024 * 1024
+
+CONTAINER_NS = "{urn:oasis:names:tc:opendocument:xmlns:container}"
+
+
+def getOpfPath(archive: zipfile.ZipFile) -> str:
+    """Finds an EPUB's package document through META-INF/container.xml.
+
+    Args:
+        archive (zipfile.ZipFile): The opened EPUB.
+
+    Returns:
+        str: Name of the package document within the archive.
+    """
+    container = ET.fromstring(archive.read("META-INF/container.xml"))
+    for rootfile in container.iter(f"{CONTAINER_NS}rootfile"):
+        return rootfile.attrib["full-path"]
+    raise Exception("META-INF/container.xml does not name a package document")
+
+
+def getOpfDir(archive: zipfile.ZipFile) -> str:
+    """Finds the directory of an EPUB's package document, which manifest hrefs are relative to.
+
+    Args:
+        archive (zipfile.ZipFile): The opened EPUB.
+
+    Returns:
+        str: Directory of the package document within the archive, "" if it is at the root.
+    """
+    return posixpath.dirname(getOpfPath(archive))
+
+
+def getZipName(opfDir: str, fileName: str) -> str:
+    """Gets the archive member name of a manifest item.
+
+    Args:
+        opfDir (str): Directory of the package document, as returned by getOpfDir.
+        fileName (str): The item's href, as in epub.EpubItem.file_name.
+
+    Returns:
+        str: Name of the item within the archive.
+    """
+    return posixpath.normpath(posixpath.join(opfDir, fileName))
+
+
+def writeEpub(
+    source: typing.Union[str, typing.BinaryIO], path: str, contents: dict[str, bytes]
+) -> str:
+    """Writes a copy of an EPUB with some of its items replaced, without decompressing anything else.
+    Unchanged members, images and fonts included, are copied as their raw compressed bytes; only the replaced items are compressed again.
+    The mimetype member is written first and uncompressed, as EPUB requires.
+
+    Args:
+        source (str | typing.BinaryIO): Path to the original EPUB, or the EPUB opened in binary mode.
+        path (str): Path to write the new EPUB to. May be the same as source.
+        contents (dict[str, bytes]): New content of the replaced items by manifest href (epub.EpubItem.file_name).
+
+    Returns:
+        str: The path written to.
+    """
+    tmpPath = f"{path}.tmp"
+    archive = zipfile.ZipFile(source)
+    try:
+        opfDir = getOpfDir(archive)
+        replaced = {getZipName(opfDir, name): data for name, data in contents.items()}
+        raw = open(source, "rb") if isinstance(source, str) else source
+        try:
+            with open(tmpPath, "wb") as out:
+                entries = []
+                infos = archive.infolist()
+                mimetype = next((i for i in infos if i.filename == "mimetype"), None)
+                if mimetype != None:
+                    data = replaced.pop("mimetype", None) or archive.read(mimetype)
+                    entries.append(writeEntry(out, mimetype, data, zipfile.ZIP_STORED))
+                for info in infos:
+                    if info is mimetype:
+                        continue
+                    if info.filename in replaced:
+                        data = replaced.pop(info.filename)
+                        entries.append(writeEntry(out, info, data))
+                    else:
+                        entries.append(copyEntry(raw, out, info))
+                # items that were not in the archive yet
+                for name, data in replaced.items():
+                    info = zipfile.ZipInfo(name, time.localtime()[:6])
+                    entries.append(writeEntry(out, info, data))
+                writeCentralDirectory(out, entries, archive.comment)
+        finally:
+            if raw is not source:
+                raw.close()
+    except BaseException:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+    finally:
+        archive.close()
+    os.replace(tmpPath, path)
+    return path
+
+
+def copyEntry(
+    raw: typing.BinaryIO, out: typing.BinaryIO, info: zipfile.ZipInfo
+) -> tuple:
+    # the local header, compressed data, and data descriptor are copied byte for byte
+    checkZip32(info.header_offset, info.compress_size, info.file_size)
+    raw.seek(info.header_offset)
+    header = raw.read(LOCAL_HEADER.size)
+    fields = LOCAL_HEADER.unpack(header)
+    if fields[0] != LOCAL_SIGNATURE:
+        raise Exception(f"bad local header for '{info.filename}'")
+    nameLength, extraLength = fields[-2:]
+    rest = raw.read(nameLength + extraLength)
+    name = rest[:nameLength]
+    offset = out.tell()
+    out.write(header + rest)
+    copyBytes(raw, out, info.compress_size)
+    if info.flag_bits & DESCRIPTOR_FLAG:
+        # the descriptor's signature is optional, its sizes are 8 bytes each in ZIP64 entries
+        sizes = 16 if ZIP64_EXTRA in getExtraIds(rest[nameLength:]) else 8
+        first = raw.read(4)
+        if first == DESCRIPTOR_SIGNATURE:
+            out.write(first + raw.read(4 + sizes))
+        else:
+            out.write(first + raw.read(sizes))
+    return (info, name, info.flag_bits, info.compress_type, offset)
+
+
+def writeEntry(
+    out: typing.BinaryIO, info: zipfile.ZipInfo, data: bytes, compressType: int = None
+) -> tuple:
+    # writes new content under an existing member's name, dates, and attributes
+    if compressType == None:
+        compressType = zipfile.ZIP_DEFLATED
+    if compressType == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+    else:
+        compressType = zipfile.ZIP_STORED
+        compressed = data
+    try:
+        name = info.filename.encode("ascii")
+        flags = 0
+    except UnicodeEncodeError:
+        name = info.filename.encode("utf-8")
+        flags = UTF8_FLAG
+    crc = zlib.crc32(data)
+    offset = out.tell()
+    checkZip32(offset, len(compressed), len(data))
+    dosTime, dosDate = getDosTime(info.date_time)
+    out.write(
+        LOCAL_HEADER.pack(
+            LOCAL_SIGNATURE,
+            20,
+            flags,
+            compressType,
+            dosTime,
+            dosDate,
+            crc,
+            len(compressed),
+            len(data),
+            len(name),
+            0,
+        )
+    )
+    out.write(name)
+    out.write(compressed)
+    written = zipfile.ZipInfo(info.filename, info.date_time)
+    written.CRC = crc
+    written.compress_size = len(compressed)
+    written.file_size = len(data)
+    written.external_attr = info.external_attr or 0o644 << 16
+    return (written, name, flags, compressType, offset)
+
+
+def writeCentralDirectory(out: typing.BinaryIO, entries: list, comment: bytes) -> None:
+    start = out.tell()
+    for info, name, flags, compressType, offset in entries:
+        dosTime, dosDate = getDosTime(info.date_time)
+        out.write(
+            CENTRAL_HEADER.pack(
+                CENTRAL_SIGNATURE,
+                info.create_version,
+                info.create_system,
+                info.extract_version,
+                info.reserved,
+                flags,
+                compressType,
+                dosTime,
+                dosDate,
+                info.CRC,
+                info.compress_size,
+                info.file_size,
+                len(name),
+                len(info.extra),
+                len(info.comment),
+                0,
+                info.internal_attr,
+                info.external_attr,
+                offset,
+            )
+        )
+        out.write(name)
+        out.write(info.extra)
+        out.write(info.comment)
+    end = out.tell()
+    if len(entries) >= 0xFFFF:
+        raise Exception("EPUBs with 65535 or more members cannot be copied")
+    checkZip32(start, end - start)
+    out.write(
+        END_RECORD.pack(
+            END_SIGNATURE,
+            0,
+            0,
+            len(entries),
+            len(entries),
+            end - start,
+            start,
+            len(comment),
+        )
+    )
+    out.write(comment)
+
+
+def copyBytes(src: typing.BinaryIO, dst: typing.BinaryIO, size: int) -> None:
+    while size > 0:
+        chunk = src.read(min(size, COPY_SIZE))
+        if not chunk:
+            raise Exception("unexpected end of archive")
+        dst.write(chunk)
+        size -= len(chunk)
+
+
+def getExtraIds(extra: bytes) -> list[int]:
+    ids = []
+    i = 0
+    while i + 4 <= len(extra):
+        headerId, size = struct.unpack("<2H", extra[i : i + 4])
+        ids.append(headerId)
+        i += 4 + size
+    return ids
+
+
+def getDosTime(dateTime: tuple) -> tuple[int, int]:
+    year, month, day, hour, minute, second = dateTime
+    dosTime = hour << 11 | minute << 5 | second // 2
+    dosDate = max(year - 1980, 0) << 9 | month << 5 | day
+    return dosTime, dosDate
+
+
+def checkZip32(*values: int) -> None:
+    # ZIP64 archives are not supported, they would need larger records throughout
+    if any(value >= ZIP32_LIMIT for value in values):
+        raise Exception("EPUBs larger than 4 GiB cannot be copied")
@@ -0,0 +1,249 @@
+import codecs
+import html
+import re
+import typing
+
+# tags whose content is not document text
+RAW_TAGS = {b"script", b"style"}
+# tags that separate words even without whitespace around them
+BLOCK_TAGS = set(
+    b"address article aside blockquote br caption dd div dl dt figcaption figure footer h1 h2 h3"
+    b" h4 h5 h6 header hr li ol p pre section table td th tr ul".split()
+)
+
+TAG = re.compile(rb"<([a-zA-Z][^\s/>]*)((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>")
+END_TAG = re.compile(rb"</([a-zA-Z][^\s>]*)[^>]*>")
+PARTIAL_TAG = re.compile(
+    rb"</?[a-zA-Z](?:[^>\"']|\"[^\"]*\"|'[^']*')*(?:\"[^\"]*|'[^']*)?\Z"
+)
+ATTR = re.compile(rb"([^\s\"'>/=]+)(?:\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s\"'>]+)))?")
+CHARSET = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([a-zA-Z0-9_\-:]+)", re.I)
+SPACES = re.compile(r"\s+")
+
+
+def sniffEncoding(head: bytes) -> str:
+    """Guesses the encoding of an HTML document from its first bytes.
+
+    Args:
+        head (bytes): The start of the document, e.g. its first 4 KiB.
+
+    Returns:
+        str: Name of the encoding, "utf-8" if none is declared. Only ASCII compatible encodings are supported.
+    """
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    match = CHARSET.search(head)
+    if match != None:
+        try:
+            return codecs.lookup(match.group(1).decode("ascii")).name
+        except LookupError:
+            pass
+    return "utf-8"
+
+
+def parseAttrs(raw: bytes, encoding: str) -> dict[str, str]:
+    """Parses the attributes of a start tag.
+
+    Args:
+        raw (bytes): Everything between the tag name and the closing ">".
+        encoding (str): Encoding of the document.
+
+    Returns:
+        dict[str, str]: Attribute values by lowercased name, with character references resolved. Attributes without a value map to "".
+    """
+    attrs = {}
+    for match in ATTR.finditer(raw):
+        name = match.group(1).decode(encoding, "replace").lower()
+        value = next((g for g in match.groups()[1:] if g != None), b"")
+        if name not in attrs:
+            attrs[name] = html.unescape(value.decode(encoding, "replace"))
+    return attrs
+
+
+def iterImgs(
+    stream: typing.BinaryIO,
+    chunkSize: int = 1024 * 1024,
+    contextSize: int = 1000,
+    encoding: str = None,
+) -> typing.Iterator[dict]:
+    """Reads an HTML document incrementally and yields its img tags as they are found, without building a tree.
+    The document is read chunkSize bytes at a time, so memory use depends on chunkSize and contextSize rather than on the document's size.
+    An img is yielded once the text after it is known: when contextSize characters of text follow it, another img starts, or the document ends.
+
+    Args:
+        stream (typing.BinaryIO): The document, opened in binary mode.
+        chunkSize (int, optional): Bytes read at a time. Defaults to 1 MiB.
+        contextSize (int, optional): Most characters of text kept as context on each side of an img. Defaults to 1000.
+        encoding (str, optional): Encoding of the document. Defaults to None, which sniffs it from the first chunk.
+
+    Returns:
+        typing.Iterator[dict]: Records with keys "src", "alt" (None if the tag has no alt attribute), "attrs", "start" and "end" (byte offsets of the tag, end exclusive), and "context" (see getContext in alttext).
+    """
+    buffer = b""
+    pos = 0  # start of the unread part of buffer
+    offset = 0  # byte offset of buffer[0] in the document
+    eof = False
+    before = ""
+    waiting = None  # an img whose following text is still being collected
+    rawTag = None
+
+    def read() -> bool:
+        # buffer is only compacted here, so scanning it never copies it
+        nonlocal buffer, pos, offset, eof, encoding
+        chunk = stream.read(chunkSize)
+        if not chunk:
+            eof = True
+            return False
+        if encoding == None:
+            encoding = sniffEncoding(chunk[:4096])
+        offset += pos
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def addText(raw: bytes) -> typing.Iterator[dict]:
+        nonlocal before, waiting
+        if contextSize <= 0:
+            return
+        text = html.unescape(raw.decode(encoding, "replace"))
+        if text.strip() == "":
+            addBoundary()
+            return
+        text = SPACES.sub(" ", text)
+        before = (before + text)[-contextSize:]
+        if waiting != None:
+            waiting["after"] += text
+            if len(waiting["after"].strip()) >= contextSize:
+                yield finish()
+
+    def addBoundary() -> None:
+        # keep word boundaries between text runs
+        nonlocal before
+        if before != "" and not before.endswith(" "):
+            before += " "
+        if waiting != None and not waiting["after"].endswith(" "):
+            waiting["after"] += " "
+
+    def finish() -> dict:
+        nonlocal waiting
+        record = waiting["record"]
+        after = waiting["after"].strip()[:contextSize]
+        record["context"][1] = after if after != "" else None
+        waiting = None
+        return record
+
+    read()
+    if encoding == None:
+        encoding = "utf-8"
+    while True:
+        if rawTag != None:
+            # skip script and style content up to their end tag
+            match = re.compile(rb"</" + rawTag + rb"\s*>", re.I).search(buffer, pos)
+            if match == None:
+                pos = max(pos, len(buffer) - len(rawTag) - 16)
+                if not read():
+                    break
+                continue
+            pos = match.end()
+            rawTag = None
+            continue
+
+        lt = buffer.find(b"<", pos)
+        if lt == -1:
+            # text is only decoded once it is whole, so characters split across reads stay intact
+            if read():
+                continue
+            if pos < len(buffer):
+                yield from addText(buffer[pos:])
+            break
+        if lt > pos:
+            yield from addText(buffer[pos:lt])
+            pos = lt
+
+        # enough input to tell comments, CDATA and tags apart
+        if len(buffer) - pos < 9 and read():
+            continue
+
+        if buffer.startswith(b"<!--", pos) or buffer.startswith(b"<![CDATA[", pos):
+            closer = b"-->" if buffer.startswith(b"<!--", pos) else b"]]>"
+            end = buffer.find(closer, pos + 4)
+            if end == -1:
+                if read():
+                    continue
+                break
+            if closer == b"]]>":
+                yield from addText(buffer[pos + 9 : end])
+            pos = end + len(closer)
+            continue
+
+        match = TAG.match(buffer, pos) or END_TAG.match(buffer, pos)
+        if match == None:
+            if buffer.startswith(b"<!", pos) or buffer.startswith(b"<?", pos):
+                end = buffer.find(b">", pos)
+                if end != -1:
+                    pos = end + 1
+                    continue
+                if read():
+                    continue
+                break
+            # a tag cut off by the end of the buffer needs more input
+            if PARTIAL_TAG.match(buffer, pos) != None and read():
+                continue
+            # a stray "<" is text
+            yield from addText(buffer[pos : pos + 1])
+            pos += 1
+            continue
+
+        name = match.group(1).lower()
+        if match.re is TAG and name == b"img":
+            if waiting != None:
+                yield finish()
+            attrs = parseAttrs(match.group(2), encoding)
+            before = before.strip()
+            record = {
+                "src": attrs.get("src"),
+                "alt": attrs.get("alt"),
+                "attrs": attrs,
+                "start": offset + pos,
+                "end": offset + match.end(),
+                "context": [before if before != "" else None, None],
+            }
+            waiting = {"record": record, "after": ""}
+        elif name in BLOCK_TAGS:
+            addBoundary()
+        elif match.re is TAG and name in RAW_TAGS and not match.group(2).endswith(b"/"):
+            rawTag = name
+        pos = match.end()
+
+    if waiting != None:
+        yield finish()
+
+
+def setAttr(tag: bytes, name: str, value: str, encoding: str) -> bytes:
+    """Sets one attribute of a start tag, leaving the rest of the tag's bytes as they are.
+
+    Args:
+        tag (bytes): The whole start tag, from "<" to ">".
+        name (str): Name of the attribute.
+        value (str): New value of the attribute, escaped as needed.
+        encoding (str): Encoding of the document.
+
+    Returns:
+        bytes: The tag with the attribute replaced, or added after the last attribute if it was missing.
+    """
+    match = TAG.match(tag)
+    if match == None:
+        raise Exception(f"not a start tag: {tag[:80]}")
+    escaped = html.escape(value, quote=True).encode(encoding, "xmlcharrefreplace")
+    attr = name.encode("ascii") + b'="' + escaped + b'"'
+    last = None
+    for found in ATTR.finditer(tag, match.start(2), match.end(2)):
+        if found.group(1).lower() == name.encode("ascii"):
+            return tag[: found.start()] + attr + tag[found.end() :]
+        last = found
+    raw = match.group(2).rstrip()
+    end = match.start(2) + len(raw)
+    # a trailing "/" closes the tag unless it belongs to an unquoted value
+    if raw.endswith(b"/") and (last == None or last.end() != end):
+        end = match.start(2) + len(raw[:-1].rstrip())
+    return tag[:end] + b" " + attr + tag[end:]
@@ -0,0 +1,114 @@
+import typing
+from collections import OrderedDict
+from threading import Lock
+
+from .cache import getDigest
+
+
+class ImageStore:
+    def __init__(
+        self, loader: typing.Callable[[str], bytes], maxSize: int = 64 * 1024 * 1024
+    ) -> None:
+        """Per-document store of image data that reads each image once and shares it across the pipeline.
+
+        Args:
+            loader (typing.Callable[[str], bytes]): Reads the data of an image given its src.
+            maxSize (int, optional): Memory budget in bytes. Least recently used images are dropped past this, and an image larger than this is never kept. Defaults to 64 MiB.
+        """
+        self.loader = loader
+        self.maxSize = maxSize
+        self.size = 0
+        self.items: OrderedDict[str, bytes] = OrderedDict()
+        self.digests: dict[str, str] = {}
+        self.loading: dict[str, Lock] = {}
+        self.lock = Lock()
+        return None
+
+    def __lookup(self, src: str) -> bytes:
+        with self.lock:
+            if src in self.items:
+                self.items.move_to_end(src)
+                return self.items[src]
+            return None
+
+    def __store(self, src: str, data: bytes) -> None:
+        with self.lock:
+            if src in self.items or len(data) > self.maxSize:
+                return
+            self.items[src] = data
+            self.size += len(data)
+            while self.size > self.maxSize:
+                _, evicted = self.items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def get(self, src: str) -> bytes:
+        """Gets the data of an image, reading it only if it is not already held.
+
+        Args:
+            src (str): Image source.
+
+        Returns:
+            bytes: Image data as bytes.
+        """
+        data = self.__lookup(src)
+        if data != None:
+            return data
+
+        with self.lock:
+            loading = self.loading.setdefault(src, Lock())
+        # threads asking for the same image wait for the first read instead of repeating it
+        with loading:
+            data = self.__lookup(src)
+            if data == None:
+                data = self.loader(src)
+                digest = getDigest(data)
+                self.__store(src, data)
+                with self.lock:
+                    self.digests[src] = digest
+        with self.lock:
+            self.loading.pop(src, None)
+        return data
+
+    def getDigest(self, src: str) -> str:
+        """Gets the SHA-256 hex digest of an image. Digests are remembered even after the data is dropped.
+
+        Args:
+            src (str): Image source.
+
+        Returns:
+            str: Hex SHA-256 digest of the image data.
+        """
+        with self.lock:
+            if src in self.digests:
+                return self.digests[src]
+        self.get(src)
+        with self.lock:
+            return self.digests[src]
+
+    def drop(self, src: str) -> bool:
+        """Drops the held data of an image, keeping its digest. The image is read again if it is needed later.
+
+        Args:
+            src (str): Image source.
+
+        Returns:
+            bool: True if data was held for the image.
+        """
+        with self.lock:
+            data = self.items.pop(src, None)
+            if data == None:
+                return False
+            self.size -= len(data)
+        return True
+
+    def clear(self) -> bool:
+        """Drops all held image data and digests.
+
+        Returns:
+            bool: True if successful.
+        """
+        with self.lock:
+            self.items.clear()
+            self.digests.clear()
+            self.size = 0
+        return True
@@ -1,7 +1,17 @@
 from abc import ABC, abstractmethod
+import asyncio
+import json
+from threading import Lock
+
+from .prompts import PromptBuilder
 
 
 class LangEngine(ABC):
+    promptBuilder: PromptBuilder = None
+    # event loop -> [client, number of open runs], created on first use since subclasses do not call __init__
+    asyncClients: dict = None
+    asyncLock = Lock()
+
     @abstractmethod
     def _completion(self, prompt: str) -> str:
         """Sends message to language model and returns its response.
@@ -101,3 +111,215 @@ class LangEngine(ABC):
             bool: True if successful.
         """
         pass
+
+    def _jsonCompletion(self, prompt: str) -> str:
+        """Sends a message to language model that asks for a JSON response and returns its response.
+        Engines whose model can be constrained to JSON output override this.
+
+        Args:
+            prompt (str): Prompt to send to language model.
+
+        Returns:
+            str: Response from language model.
+        """
+        return self._completion(prompt)
+
+    def getPromptBuilder(self) -> PromptBuilder:
+        """Gets the prompt builder used to assemble and truncate prompts.
+
+        Returns:
+            PromptBuilder: The engine's prompt builder, created with default budgets if none was given.
+        """
+        if self.promptBuilder == None:
+            self.promptBuilder = PromptBuilder()
+        return self.promptBuilder
+
+    def genBatchPrompt(self, items: list[dict]) -> str:
+        """Generates one prompt asking for alt-text for many images in V2 Dataflow.
+
+        Args:
+            items (list[dict]): Images to generate alt-text for. Each has key "desc" and optionally "chars", "context" and "caption", as in refineAlt.
+
+        Returns:
+            str: Prompt to send to language model.
+        """
+        return self.getPromptBuilder().buildBatch(items)
+
+    def __parseBatch(self, response: str, count: int) -> list[str]:
+        # models sometimes wrap JSON in prose or code fences, so only the outermost object is read
+        alts = [None] * count
+        try:
+            start = response.index("{")
+            end = response.rindex("}") + 1
+            entries = json.loads(response[start:end])["alts"]
+        except Exception:
+            return alts
+        if not isinstance(entries, list):
+            return alts
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            i = entry.get("id")
+            alt = entry.get("alt")
+            if isinstance(i, int) and 0 <= i < count and isinstance(alt, str):
+                if alt.strip() != "":
+                    alts[i] = alt.strip()
+        return alts
+
+    def refineAltMany(self, items: list[dict]) -> list[str]:
+        """Generates alt-text for many images with a single request.
+        Used in V2 Dataflow. Images missing from, or invalid in, the response are refined individually with refineAlt.
+        An image whose individual refinement fails is None, without discarding the others.
+
+        Args:
+            items (list[dict]): Images to generate alt-text for. Each has key "desc" and optionally "chars", "context" and "caption", as in refineAlt.
+
+        Returns:
+            list[str]: Alt-text for each image, in the same order as items. None for images that could not be refined.
+        """
+        if len(items) == 0:
+            return []
+        alts = [None] * len(items)
+        if len(items) > 1:
+            try:
+                response = self._jsonCompletion(self.genBatchPrompt(items))
+                alts = self.__parseBatch(response, len(items))
+            except Exception:
+                pass
+        for i, item in enumerate(items):
+            if alts[i] != None:
+                continue
+            try:
+                alts[i] = self.refineAlt(
+                    item["desc"],
+                    item.get("chars"),
+                    item.get("context"),
+                    item.get("caption"),
+                )
+            except Exception:
+                alts[i] = None
+        return alts
+
+    async def _completionAsync(self, prompt: str) -> str:
+        """Async variant of _completion. Runs _completion in a worker thread unless the engine has a native async client.
+
+        Args:
+            prompt (str): Prompt to send to language model.
+
+        Returns:
+            str: Response from language model.
+        """
+        return await asyncio.to_thread(self._completion, prompt)
+
+    async def refineDescAsync(self, description: str) -> str:
+        """Async variant of refineDesc.
+
+        Args:
+            description (str): Description of an image.
+
+        Returns:
+            str: Refinement of description.
+        """
+        return await asyncio.to_thread(self.refineDesc, description)
+
+    async def refineOCRAsync(self, chars: str) -> str:
+        """Async variant of refineOCR.
+
+        Args:
+            chars (str): Characters found in an image.
+
+        Returns:
+            str: Refinement of characters.
+        """
+        return await asyncio.to_thread(self.refineOCR, chars)
+
+    async def refineAltAsync(
+        self,
+        desc: str,
+        chars: str = None,
+        context: list[str] = None,
+        caption: str = None,
+    ) -> str:
+        """Async variant of refineAlt.
+
+        Args:
+            desc (str): Description of an image.
+            chars (str, optional): Characters found in an image. Defaults to None.
+            context (list[str], optional): Context of an image. See getContext in alttext for more information. Defaults to None.
+            caption (str, optional): Caption of an image. Defaults to None.
+
+        Returns:
+            str: Alt-text for an image.
+        """
+        prompt = self.genPrompt(desc, chars, context, caption)
+        return await self._completionAsync(prompt)
+
+    def _openAsyncClient(self):
+        """Creates the native async client used for calls on the running event loop.
+
+        Returns:
+            Client for _completionAsync, or None for engines without one.
+        """
+        return None
+
+    async def _closeAsyncClient(self, client) -> None:
+        """Closes a client created by _openAsyncClient.
+
+        Args:
+            client: Client to close.
+        """
+        return None
+
+    def _getAsyncClient(self):
+        """Gets the running event loop's native async client, creating it if needed.
+
+        Returns:
+            Client for _completionAsync, or None for engines without one.
+        """
+        # pooled connections belong to the event loop that opened them, so each loop gets its own client
+        loop = asyncio.get_running_loop()
+        with LangEngine.asyncLock:
+            if self.asyncClients == None:
+                self.asyncClients = {}
+            # clients of loops that already ended cannot be closed anymore, only dropped
+            for ended in [l for l in self.asyncClients if l.is_closed()]:
+                del self.asyncClients[ended]
+            if loop not in self.asyncClients:
+                client = self._openAsyncClient()
+                if client == None:
+                    return None
+                self.asyncClients[loop] = [client, 0]
+            return self.asyncClients[loop][0]
+
+    async def openAsync(self) -> None:
+        """Marks the start of a run of async calls on the running event loop.
+        Engines with a native async client keep the loop's client open until the matching closeAsync. Does nothing otherwise.
+        """
+        if self._getAsyncClient() == None:
+            return None
+        with LangEngine.asyncLock:
+            self.asyncClients[asyncio.get_running_loop()][1] += 1
+
+    async def closeAsync(self) -> None:
+        """Marks the end of a run started with openAsync.
+        Engines with a native async client close the loop's client once no run on the loop is left. Does nothing otherwise.
+        """
+        with LangEngine.asyncLock:
+            loop = asyncio.get_running_loop()
+            entry = None if self.asyncClients == None else self.asyncClients.get(loop)
+            if entry == None:
+                return None
+            entry[1] -= 1
+            if entry[1] > 0:
+                return None
+            del self.asyncClients[loop]
+        await self._closeAsyncClient(entry[0])
+
+    def getIdentity(self) -> str:
+        """Gets a string identifying the engine and the model it uses.
+        Used to key cached results, so it should change whenever the engine would produce different output.
+
+        Returns:
+            str: Identity of the language engine.
+        """
+        return type(self).__name__
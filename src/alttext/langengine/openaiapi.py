@@ -1,11 +1,17 @@
 import openai
 import os
 
+from .langengine import LangEngine
+from .prompts import PromptBuilder
 
-class OpenAIAPI:
-    def __init__(self, key: str, model: str) -> None:
+
+class OpenAIAPI(LangEngine):
+    def __init__(
+        self, key: str, model: str, promptBuilder: PromptBuilder = None
+    ) -> None:
         self.__setKey(key)
         self.__setModel(model)
+        self.promptBuilder = promptBuilder
         self.client = openai.OpenAI()
         return
 
@@ -18,6 +24,9 @@ class OpenAIAPI:
         self.model = model
         return True
 
+    def getIdentity(self) -> str:
+        return f"OpenAIAPI:{self.model}:{self.getPromptBuilder().getIdentity()}"
+
     def _completion(self, prompt: str) -> str:
         completion = self.client.chat.completions.create(
             model=self.model,
@@ -29,75 +38,45 @@ class OpenAIAPI:
 
         return completion.choices[0].message.content
 
-    def refineDesc(self, description: str) -> str:
-        prompt = f"""The following string surrounded with '///' was generated by an Image Captioning AI when ran on some arbitrary image.
-///{description}///
-
-Your goal is to refine the string to be inserted as alt-text for an image in an Ebook.
+    def _jsonCompletion(self, prompt: str) -> str:
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": prompt},
+            ],
+        )
 
-Here are guidelines to follow...
-1. Prioritize information in text alternative:
-Aim to put the most important information at the beginning.
-2. Length of the text alternative:
-The alt text should be the most concise description possible of the image's purpose. If anything more than a short phrase or sentence is needed, it would be better to use one of the long description methods discussed in complex images.
-3. Superfluous information in the text alternative:
-Usually, there's no need to include words like “image”, “icon”, or “picture” in the alt text. People who can see will know this already, and screen readers announce the presence of an image. In some situations, it may be important to distinguish between paintings, photographs, or illustrations, etc., but it's best to avoid the more generic use of the terms.
+        return completion.choices[0].message.content
 
-Format your response as...
-The refined string is: <refined_string>
+    def _openAsyncClient(self) -> openai.AsyncOpenAI:
+        return openai.AsyncOpenAI()
 
-If the string is empty, simply respond with...
-The refined string is: N/A"""
-        return self._completion(prompt)
+    async def _closeAsyncClient(self, client: openai.AsyncOpenAI) -> None:
+        await client.close()
 
-    def refineOCR(self, chars: str) -> str:
-        prompt = f"""The following string surrounded with '///' was generated by an Optical Character Recognition software when ran on some arbitrary image.
-///
-{chars}
-///
+    async def _completionAsync(self, prompt: str) -> str:
+        completion = await self._getAsyncClient().chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": prompt},
+            ],
+        )
 
-Your goal is to refine the string.
-There may be random/excess spaces or other characters in the string, please remove them.
-Do not surround the refined string in quotation marks.
+        return completion.choices[0].message.content
 
-Format your response as...
-The refined string is: <refined_string>
+    def refineDesc(self, description: str) -> str:
+        prompt = self.getPromptBuilder().buildDesc(description)
+        return self._completion(prompt)
 
-If the string is empty, simply respond with...
-The refined string is: N/A"""
+    def refineOCR(self, chars: str) -> str:
+        prompt = self.getPromptBuilder().buildOCR(chars)
         return self._completion(prompt)
 
     def genPrompt(self, desc: str, chars: str, context: list[str], caption: str) -> str:
-        ocr = ""
-        if chars != None and chars != "":
-            ocr = f"\nThe following string surrounded with '///' was generated by an Optical Character Recognition software when ran on the image.\n///{chars}///"
-        before = ""
-        if context[0] != None and context[0] != "":
-            before = f"\nThe following string surrounded with '///' is the nearest text found before the image.\n///{context[0]}///"
-        after = ""
-        if context[1] != None and context[1] != "":
-            after = f"\nThe following string surrounded with '///' is the nearest text found after the image.\n///{context[1]}///"
-        cap = ""
-        if caption != None and caption != "":
-            cap = f"\nThe following string surrounded with '///' is a caption in the Ebook for the image.\n///{caption}///"
-
-        prompt = f"""There following information is regarding an image found in an Ebook with no alternative-text.
-The following string surrounded with '///' was generated by an Image Captioning AI when ran on the image.
-///{desc}///{ocr}{cap}{before}{after}
-
-Your goal is to create alternative-text for the image given the prior information.
-
-Here are guidelines to follow to create quality alt-text...
-1. Prioritize information in text alternative:
-Aim to put the most important information at the beginning.
-2. Length of the text alternative:
-The alt text should be the most concise description possible of the image's purpose. If anything more than a short phrase or sentence is needed, it would be better to use one of the long description methods discussed in complex images.
-3. Superfluous information in the text alternative:
-Usually, there's no need to include words like “image”, “icon”, or “picture” in the alt text. People who can see will know this already, and screen readers announce the presence of an image. In some situations, it may be important to distinguish between paintings, photographs, or illustrations, etc., but it's best to avoid the more generic use of the terms.
-
-Using all of the information stated, please generate alt-text for the image.
-In your response, please only give the alt-text."""
-        return prompt
+        return self.getPromptBuilder().buildAlt(desc, chars, context, caption)
 
     def refineAlt(
         self,
@@ -1,16 +1,135 @@
+import asyncio
+import random
+import time
+from threading import Lock
+
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 
 from .langengine import LangEngine
+from .prompts import PromptBuilder
+
+# statuses worth retrying: the server is overloaded, restarting, or behind a proxy that gave up
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
 
 class PrivateGPT(LangEngine):
-    def __init__(self, host) -> None:
+    def __init__(
+        self,
+        host,
+        poolSize: int = 8,
+        timeout: tuple[float, float] = (5, 300),
+        retries: int = 3,
+        backoff: float = 0.5,
+        promptBuilder: PromptBuilder = None,
+    ) -> None:
+        """Language engine backed by a PrivateGPT API server.
+
+        Args:
+            host (str): Base URL of the server, e.g. "http://127.0.0.1:8001".
+            poolSize (int, optional): Maximum number of pooled connections. Should match the "maxWorkers" (or "asyncConcurrency") option of the AltText object using the engine. Defaults to 8.
+            timeout (tuple[float, float], optional): Connect and read timeouts in seconds. Defaults to (5, 300).
+            retries (int, optional): Number of retries after a connection error, timeout, or 429/5xx response. Defaults to 3.
+            backoff (float, optional): Base delay in seconds for exponential backoff with full jitter between retries. Defaults to 0.5.
+            promptBuilder (PromptBuilder, optional): Assembles prompts and bounds the size of each field. Defaults to None, which uses PromptBuilder's default budgets.
+        """
         self.host = host
+        self.poolSize = poolSize
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.promptBuilder = promptBuilder
+
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_maxsize=poolSize, pool_block=True)
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+        self.statsLock = Lock()
 
     def __setHost(self, host) -> bool:
         self.host = host
         return True
 
+    def getIdentity(self) -> str:
+        return f"PrivateGPT:{self.host}:{self.getPromptBuilder().getIdentity()}"
+
+    def getPoolStats(self) -> dict:
+        """Gets connection pool and request statistics.
+
+        Returns:
+            dict: Keys "poolSize", "connectionsOpened", "requests", "retries" and "failures".
+        """
+        pools = self.adapter.poolmanager.pools
+        opened = sum(pools[key].num_connections for key in pools.keys())
+        with self.statsLock:
+            stats = dict(self.stats)
+        stats["poolSize"] = self.poolSize
+        stats["connectionsOpened"] = opened
+        return stats
+
+    def __count(self, key: str) -> None:
+        with self.statsLock:
+            self.stats[key] += 1
+
+    def __retryDelay(self, attempt: int) -> float:
+        return random.uniform(0, self.backoff * 2**attempt)
+
+    def __request(self, method: str, path: str, **kwargs) -> requests.Response:
+        attempt = 0
+        while True:
+            self.__count("requests")
+            try:
+                r = self.session.request(
+                    method, f"{self.host}{path}", timeout=self.timeout, **kwargs
+                )
+                if r.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    r.raise_for_status()
+                    return r
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    self.__count("failures")
+                    raise
+            except requests.HTTPError:
+                self.__count("failures")
+                raise
+            self.__count("retries")
+            time.sleep(self.__retryDelay(attempt))
+            attempt += 1
+
+    def _openAsyncClient(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+            limits=httpx.Limits(max_connections=self.poolSize),
+        )
+
+    async def _closeAsyncClient(self, client: httpx.AsyncClient) -> None:
+        await client.aclose()
+
+    async def __requestAsync(self, method: str, path: str, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            self.__count("requests")
+            try:
+                r = await self._getAsyncClient().request(
+                    method, f"{self.host}{path}", **kwargs
+                )
+                if r.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    r.raise_for_status()
+                    return r
+            except (httpx.TransportError, httpx.TimeoutException):
+                if attempt >= self.retries:
+                    self.__count("failures")
+                    raise
+            except httpx.HTTPStatusError:
+                self.__count("failures")
+                raise
+            self.__count("retries")
+            await asyncio.sleep(self.__retryDelay(attempt))
+            attempt += 1
+
     def _completion(self, prompt: str) -> str:
         body = {
             "include_sources": False,
@@ -18,79 +137,31 @@ class PrivateGPT(LangEngine):
             "stream": False,
             "use_context": False,
         }
-        r = requests.post(f"{self.host}/v1/completions", json=body)
+        r = self.__request("POST", "/v1/completions", json=body)
         r = r.json()
         return r["choices"][0]["message"]["content"].strip()
 
-    def refineDesc(self, description: str) -> str:
-        prompt = f"""The following string surrounded with '///' was generated by an Image Captioning AI when ran on some arbitrary image.
-///{description}///
-
-Your goal is to refine the string to be inserted as alt-text for an image in an Ebook.
-
-Here are guidelines to follow...
-1. Prioritize information in text alternative:
-Aim to put the most important information at the beginning.
-2. Length of the text alternative:
-The alt text should be the most concise description possible of the image's purpose. If anything more than a short phrase or sentence is needed, it would be better to use one of the long description methods discussed in complex images.
-3. Superfluous information in the text alternative:
-Usually, there's no need to include words like “image”, “icon”, or “picture” in the alt text. People who can see will know this already, and screen readers announce the presence of an image. In some situations, it may be important to distinguish between paintings, photographs, or illustrations, etc., but it's best to avoid the more generic use of the terms.
-
-Format your response as...
-The refined string is: <refined_string>
+    async def _completionAsync(self, prompt: str) -> str:
+        body = {
+            "include_sources": False,
+            "prompt": prompt,
+            "stream": False,
+            "use_context": False,
+        }
+        r = await self.__requestAsync("POST", "/v1/completions", json=body)
+        r = r.json()
+        return r["choices"][0]["message"]["content"].strip()
 
-If the string is empty, simply respond with...
-The refined string is: N/A"""
+    def refineDesc(self, description: str) -> str:
+        prompt = self.getPromptBuilder().buildDesc(description)
         return self._completion(prompt)
 
     def refineOCR(self, chars: str) -> str:
-        prompt = f"""The following string surrounded with '///' was generated by an Optical Character Recognition software when ran on some arbitrary image.
-///
-{chars}
-///
-
-Your goal is to refine the string.
-There may be random/excess spaces or other characters in the string, please remove them.
-Do not surround the refined string in quotation marks.
-
-Format your response as...
-The refined string is: <refined_string>
-
-If the string is empty, simply respond with...
-The refined string is: N/A"""
+        prompt = self.getPromptBuilder().buildOCR(chars)
         return self._completion(prompt)
 
     def genPrompt(self, desc: str, chars: str, context: list[str], caption: str) -> str:
-        ocr = ""
-        if chars != None and chars != "":
-            ocr = f"\nThe following string surrounded with '///' was generated by an Optical Character Recognition software when ran on the image.\n///{chars}///"
-        before = ""
-        if context[0] != None and context[0] != "":
-            before = f"\nThe following string surrounded with '///' is the nearest text found before the image.\n///{context[0]}///"
-        after = ""
-        if context[1] != None and context[1] != "":
-            after = f"\nThe following string surrounded with '///' is the nearest text found after the image.\n///{context[1]}///"
-        cap = ""
-        if caption != None and caption != "":
-            cap = f"\nThe following string surrounded with '///' is a caption in the Ebook for the image.\n///{caption}///"
-
-        prompt = f"""There following information is regarding an image found in an Ebook with no alternative-text.
-The following string surrounded with '///' was generated by an Image Captioning AI when ran on the image.
-///{desc}///{ocr}{cap}{before}{after}
-
-Your goal is to create alternative-text for the image given the prior information.
-
-Here are guidelines to follow to create quality alt-text...
-1. Prioritize information in text alternative:
-Aim to put the most important information at the beginning.
-2. Length of the text alternative:
-The alt text should be the most concise description possible of the image's purpose. If anything more than a short phrase or sentence is needed, it would be better to use one of the long description methods discussed in complex images.
-3. Superfluous information in the text alternative:
-Usually, there's no need to include words like “image”, “icon”, or “picture” in the alt text. People who can see will know this already, and screen readers announce the presence of an image. In some situations, it may be important to distinguish between paintings, photographs, or illustrations, etc., but it's best to avoid the more generic use of the terms.
-
-Using all of the information stated, please generate alt-text for the image.
-In your response, please only give the alt-text."""
-        return prompt
+        return self.getPromptBuilder().buildAlt(desc, chars, context, caption)
 
     def refineAlt(
         self,
@@ -109,12 +180,15 @@ In your response, please only give the alt-text."""
 
     def ingest(self, filename: str, binary) -> bool:
         ext = filename.split(".")[1]
+        # read once so a retry can resend the same bytes
+        if hasattr(binary, "read"):
+            binary = binary.read()
         files = {"file": (filename, binary, f"application/{ext}")}
         headers = {"accept": "application/json"}
-        r = requests.post(f"{self.host}/v1/ingest", files=files, headers=headers)
+        r = self.__request("POST", "/v1/ingest", files=files, headers=headers)
         return True
 
     def degest(self, filename: str) -> bool:
         headers = {"accept": "application/json"}
-        r = requests.delete(f"{self.host}/v1/ingest/{filename}", headers=headers)
+        r = self.__request("DELETE", f"/v1/ingest/{filename}", headers=headers)
         return True
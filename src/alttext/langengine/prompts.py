@@ -0,0 +1,284 @@
+import json
+import typing
+from threading import Lock
+
+GUIDELINES = """1. Prioritize information in text alternative:
+Aim to put the most important information at the beginning.
+2. Length of the text alternative:
+The alt text should be the most concise description possible of the image's purpose. If anything more than a short phrase or sentence is needed, it would be better to use one of the long description methods discussed in complex images.
+3. Superfluous information in the text alternative:
+Usually, there's no need to include words like “image”, “icon”, or “picture” in the alt text. People who can see will know this already, and screen readers announce the presence of an image. In some situations, it may be important to distinguish between paintings, photographs, or illustrations, etc., but it's best to avoid the more generic use of the terms."""
+
+DESC_TEMPLATE = (
+    """The following string surrounded with '///' was generated by an Image Captioning AI when ran on some arbitrary image.
+///{desc}///
+
+Your goal is to refine the string to be inserted as alt-text for an image in an Ebook.
+
+Here are guidelines to follow...
+"""
+    + GUIDELINES.replace("{", "{{").replace("}", "}}")
+    + """
+
+Format your response as...
+The refined string is: <refined_string>
+
+If the string is empty, simply respond with...
+The refined string is: N/A"""
+)
+
+OCR_TEMPLATE = """The following string surrounded with '///' was generated by an Optical Character Recognition software when ran on some arbitrary image.
+///
+{chars}
+///
+
+Your goal is to refine the string.
+There may be random/excess spaces or other characters in the string, please remove them.
+Do not surround the refined string in quotation marks.
+
+Format your response as...
+The refined string is: <refined_string>
+
+If the string is empty, simply respond with...
+The refined string is: N/A"""
+
+ALT_TEMPLATE = (
+    """There following information is regarding an image found in an Ebook with no alternative-text.
+The following string surrounded with '///' was generated by an Image Captioning AI when ran on the image.
+///{desc}///{ocr}{cap}{before}{after}
+
+Your goal is to create alternative-text for the image given the prior information.
+
+Here are guidelines to follow to create quality alt-text...
+"""
+    + GUIDELINES.replace("{", "{{").replace("}", "}}")
+    + """
+
+Using all of the information stated, please generate alt-text for the image.
+In your response, please only give the alt-text."""
+)
+
+ALT_SECTIONS = {
+    "chars": "\nThe following string surrounded with '///' was generated by an Optical Character Recognition software when ran on the image.\n///{}///",
+    "caption": "\nThe following string surrounded with '///' is a caption in the Ebook for the image.\n///{}///",
+    "before": "\nThe following string surrounded with '///' is the nearest text found before the image.\n///{}///",
+    "after": "\nThe following string surrounded with '///' is the nearest text found after the image.\n///{}///",
+}
+
+BATCH_TEMPLATE = (
+    """The following JSON lists images found in an Ebook with no alternative-text.
+For each image, "desc" was generated by an Image Captioning AI when ran on the image, "chars" was generated by an Optical Character Recognition software when ran on the image, "caption" is a caption in the Ebook for the image, and "before" and "after" are the nearest text found before and after the image. Any of these other than "desc" may be missing.
+{images}
+
+Your goal is to create alternative-text for each image given its information.
+
+Here are guidelines to follow to create quality alt-text...
+"""
+    + GUIDELINES.replace("{", "{{").replace("}", "}}")
+    + """
+
+Respond only with JSON of the form...
+{{"alts": [{{"id": <id of the image>, "alt": "<alt-text for the image>"}}]}}
+with exactly one entry for every image."""
+)
+
+# tokens allowed per field, text before an image keeps its end and everything else keeps its start
+DEFBUDGETS = {
+    "desc": 300,
+    "chars": 500,
+    "caption": 150,
+    "before": 250,
+    "after": 250,
+}
+
+
+def estimateTokens(text: str) -> int:
+    """Estimates the number of tokens in a string, at roughly 4 characters per token for English text.
+
+    Args:
+        text (str): Text to count.
+
+    Returns:
+        int: Estimated number of tokens.
+    """
+    return (len(text) + 3) // 4
+
+
+class PromptBuilder:
+    def __init__(
+        self,
+        budgets: dict = {},
+        tokenizer: typing.Callable[[str], int] = estimateTokens,
+    ) -> None:
+        """Assembles language model prompts, truncating each field to a token budget.
+
+        Args:
+            budgets (dict, optional): Token budgets overriding DEFBUDGETS, keyed by field ("desc", "chars", "caption", "before", "after"). A budget of None leaves the field untruncated. Defaults to {}.
+            tokenizer (typing.Callable[[str], int], optional): Counts the tokens in a string. Defaults to estimateTokens.
+        """
+        self.budgets = dict(DEFBUDGETS)
+        for key in dict.keys(budgets):
+            self.budgets[key] = budgets[key]
+        self.tokenizer = tokenizer
+        self.stats = {"prompts": 0, "tokens": 0, "truncated": 0}
+        self.statsLock = Lock()
+        return None
+
+    def getIdentity(self) -> str:
+        """Gets a string identifying the templates and budgets. Engines add it to their own identity.
+
+        Returns:
+            str: Identity of the prompt builder.
+        """
+        budgets = ",".join(f"{k}={v}" for k, v in sorted(self.budgets.items()))
+        return f"PromptBuilder:{budgets}"
+
+    def countTokens(self, text: str) -> int:
+        """Counts the tokens in a string with the builder's tokenizer.
+
+        Args:
+            text (str): Text to count.
+
+        Returns:
+            int: Number of tokens.
+        """
+        return self.tokenizer(text)
+
+    def getStats(self) -> dict:
+        """Gets how many prompts were built, their total tokens, and how many fields were truncated.
+
+        Returns:
+            dict: {"prompts": int, "tokens": int, "truncated": int}
+        """
+        with self.statsLock:
+            return dict(self.stats)
+
+    def truncate(self, field: str, text: str) -> str:
+        """Truncates text to its field's token budget.
+        Text before an image keeps its end, the part nearest the image; other fields keep their start.
+
+        Args:
+            field (str): Field name, e.g. "before".
+            text (str): Text to truncate.
+
+        Returns:
+            str: Text within budget, marked with "..." where it was cut.
+        """
+        budget = self.budgets.get(field)
+        if text == None or budget == None or self.tokenizer(text) <= budget:
+            return text
+        keepEnd = field == "before"
+
+        # longest slice within budget, found by binary search since tokenizers are not linear
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            part = text[-mid:] if keepEnd else text[:mid]
+            if self.tokenizer(part) + 1 <= budget:
+                low = mid
+            else:
+                high = mid - 1
+        part = text[-low:] if keepEnd and low > 0 else text[:low]
+
+        # avoid leaving half a word at the cut
+        if keepEnd and " " in part:
+            part = part[part.index(" ") + 1 :]
+        elif not keepEnd and " " in part:
+            part = part[: part.rindex(" ")]
+        with self.statsLock:
+            self.stats["truncated"] += 1
+        return f"...{part}" if keepEnd else f"{part}..."
+
+    def __finish(self, prompt: str) -> str:
+        tokens = self.tokenizer(prompt)
+        with self.statsLock:
+            self.stats["prompts"] += 1
+            self.stats["tokens"] += tokens
+        return prompt
+
+    def buildDesc(self, description: str) -> str:
+        """Builds the prompt refining a description in V1 Dataflow.
+
+        Args:
+            description (str): Description of an image.
+
+        Returns:
+            str: Prompt to send to language model.
+        """
+        return self.__finish(
+            DESC_TEMPLATE.format(desc=self.truncate("desc", description))
+        )
+
+    def buildOCR(self, chars: str) -> str:
+        """Builds the prompt refining characters found in an image in V1 Dataflow.
+
+        Args:
+            chars (str): Characters found in an image.
+
+        Returns:
+            str: Prompt to send to language model.
+        """
+        return self.__finish(OCR_TEMPLATE.format(chars=self.truncate("chars", chars)))
+
+    def buildAlt(self, desc: str, chars: str, context: list[str], caption: str) -> str:
+        """Builds the prompt generating alt-text in V2 Dataflow.
+
+        Args:
+            desc (str): Description of an image.
+            chars (str): Characters found in an image.
+            context (list[str]): Context of an image. See getContext in alttext for more information.
+            caption (str): Caption of an image.
+
+        Returns:
+            str: Prompt to send to language model.
+        """
+        context = context if context != None else [None, None]
+        values = {
+            "chars": chars,
+            "caption": caption,
+            "before": context[0],
+            "after": context[1],
+        }
+        sections = {}
+        for field, value in values.items():
+            sections[field] = ""
+            if value != None and value != "":
+                sections[field] = ALT_SECTIONS[field].format(
+                    self.truncate(field, value)
+                )
+        return self.__finish(
+            ALT_TEMPLATE.format(
+                desc=self.truncate("desc", desc),
+                ocr=sections["chars"],
+                cap=sections["caption"],
+                before=sections["before"],
+                after=sections["after"],
+            )
+        )
+
+    def buildBatch(self, items: list[dict]) -> str:
+        """Builds one prompt generating alt-text for many images in V2 Dataflow.
+
+        Args:
+            items (list[dict]): Images to generate alt-text for. Each has key "desc" and optionally "chars", "context" and "caption".
+
+        Returns:
+            str: Prompt to send to language model.
+        """
+        images = []
+        for i, item in enumerate(items):
+            image = {"id": i, "desc": self.truncate("desc", item["desc"])}
+            context = item.get("context") or [None, None]
+            fields = [
+                ("chars", item.get("chars")),
+                ("caption", item.get("caption")),
+                ("before", context[0]),
+                ("after", context[1]),
+            ]
+            for name, value in fields:
+                if value != None and value != "":
+                    image[name] = self.truncate(name, value)
+            images.append(image)
+        return self.__finish(
+            BATCH_TEMPLATE.format(images=json.dumps(images, ensure_ascii=False))
+        )
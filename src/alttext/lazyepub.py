@@ -0,0 +1,186 @@
+import io
+import mmap
+import posixpath
+import typing
+import urllib.parse
+import xml.etree.ElementTree as ET
+import zipfile
+
+import ebooklib
+
+from .epubwriter import getOpfPath, getZipName
+
+OPF_NS = "{http://www.idpf.org/2007/opf}"
+
+
+class MappedFile(io.RawIOBase):
+    def __init__(self, mapped: mmap.mmap) -> None:
+        # mmap objects lack parts of the file interface zipfile needs
+        self.mapped = mapped
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self.mapped.seek(offset, whence)
+        return self.mapped.tell()
+
+    def tell(self) -> int:
+        return self.mapped.tell()
+
+    def read(self, size: int = -1) -> bytes:
+        return self.mapped.read(None if size == None or size < 0 else size)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self.mapped.close()
+        super().close()
+
+
+class LazyEpubItem:
+    def __init__(
+        self, book: "LazyEpub", id: str, fileName: str, mediaType: str
+    ) -> None:
+        """A manifest item of a LazyEpub, read from the archive whenever its content is asked for.
+        Mirrors the parts of epub.EpubItem that AltTextEPUB uses.
+
+        Args:
+            book (LazyEpub): The book the item belongs to.
+            id (str): Manifest id.
+            fileName (str): Manifest href, relative to the package document.
+            mediaType (str): Manifest media type.
+        """
+        self.book = book
+        self.id = id
+        self.file_name = fileName
+        self.media_type = mediaType
+        self.zipName = getZipName(book.opfDir, fileName)
+        self.replaced = None
+        return None
+
+    @property
+    def content(self) -> bytes:
+        if self.replaced != None:
+            return self.replaced
+        return self.book.read(self.zipName)
+
+    def get_id(self) -> str:
+        return self.id
+
+    def get_name(self) -> str:
+        return self.file_name
+
+    def get_type(self) -> int:
+        if self.media_type == "application/xhtml+xml":
+            return ebooklib.ITEM_DOCUMENT
+        _, ext = posixpath.splitext(self.file_name)
+        for itemType, extensions in ebooklib.EXTENSIONS.items():
+            if ext.lower() in extensions:
+                return itemType
+        return ebooklib.ITEM_UNKNOWN
+
+    def get_content(self, default: bytes = b"") -> bytes:
+        """Gets the content of the item. Unless it was replaced, it is read from the archive again on every call and not kept.
+
+        Returns:
+            bytes: Content of the item.
+        """
+        return self.content or default
+
+    def set_content(self, content: bytes) -> None:
+        """Replaces the content of the item. The new content is held in memory until the book is written.
+
+        Args:
+            content (bytes): New content of the item.
+        """
+        self.replaced = content
+
+
+class LazyEpub:
+    def __init__(self, path: str, useMmap: bool = False) -> None:
+        """An EPUB read on demand from its archive, instead of loading every item up front like epub.read_epub.
+        Only the central directory and package document are read when opened. Mirrors the parts of epub.EpubBook that AltTextEPUB uses.
+
+        Args:
+            path (str): Path to the EPUB.
+            useMmap (bool, optional): Whether to memory map the archive, so items are read from the page cache instead of through file reads. Defaults to False.
+        """
+        self.path = path
+        self.file = open(path, "rb")
+        self.source = self.file
+        if useMmap:
+            self.source = MappedFile(
+                mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            )
+        self.archive = zipfile.ZipFile(self.source)
+        self.opfPath = getOpfPath(self.archive)
+        self.opfDir = posixpath.dirname(self.opfPath)
+        self.items: list[LazyEpubItem] = []
+        self.hrefs: dict[str, LazyEpubItem] = {}
+        self.__loadManifest()
+        return None
+
+    def __loadManifest(self) -> None:
+        package = ET.fromstring(self.archive.read(self.opfPath))
+        manifest = package.find(f"{OPF_NS}manifest")
+        if manifest == None:
+            raise Exception("the package document has no manifest")
+        for item in manifest.iter(f"{OPF_NS}item"):
+            mediaType = item.get("media-type")
+            # people use wrong content types
+            if mediaType == "image/jpg":
+                mediaType = "image/jpeg"
+            fileName = urllib.parse.unquote(item.get("href"))
+            lazyItem = LazyEpubItem(self, item.get("id"), fileName, mediaType)
+            self.items.append(lazyItem)
+            self.hrefs.setdefault(fileName, lazyItem)
+
+    def read(self, zipName: str) -> bytes:
+        """Reads a member of the archive.
+
+        Args:
+            zipName (str): Name of the member.
+
+        Returns:
+            bytes: Uncompressed data of the member.
+        """
+        return self.archive.read(zipName)
+
+    def get_items(self) -> typing.Iterator[LazyEpubItem]:
+        return iter(self.items)
+
+    def get_items_of_type(self, itemType: int) -> typing.Iterator[LazyEpubItem]:
+        return (item for item in self.items if item.get_type() == itemType)
+
+    def get_item_with_id(self, id: str) -> LazyEpubItem:
+        return next((item for item in self.items if item.id == id), None)
+
+    def get_item_with_href(self, href: str) -> LazyEpubItem:
+        return self.hrefs.get(href)
+
+    def getReplaced(self) -> dict[str, bytes]:
+        """Gets the content of the items replaced with set_content.
+
+        Returns:
+            dict[str, bytes]: New content by manifest href.
+        """
+        return {
+            item.file_name: item.replaced
+            for item in self.items
+            if item.replaced != None
+        }
+
+    def close(self) -> None:
+        """Closes the archive."""
+        self.archive.close()
+        if self.source is not self.file:
+            self.source.close()
+        self.file.close()
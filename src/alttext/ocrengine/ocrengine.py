@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+import asyncio
 
 
 class OCREngine(ABC):
@@ -15,3 +16,25 @@ class OCREngine(ABC):
             str: Characters found in an image.
         """
         pass
+
+    async def genCharsAsync(self, imgData: bytes, src: str, context: str = None) -> str:
+        """Async variant of genChars. Runs genChars in a worker thread unless the engine has a native async implementation.
+
+        Args:
+            imgData (bytes): Image data in bytes.
+            src (str): Image source.
+            context (str, optional): Context of an image. See getContext in alttext for more information. Defaults to None.
+
+        Returns:
+            str: Characters found in an image.
+        """
+        return await asyncio.to_thread(self.genChars, imgData, src, context)
+
+    def getIdentity(self) -> str:
+        """Gets a string identifying the engine and the model it uses.
+        Used to key cached results, so it should change whenever the engine would produce different output.
+
+        Returns:
+            str: Identity of the OCR engine.
+        """
+        return type(self).__name__
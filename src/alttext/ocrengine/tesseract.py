@@ -1,13 +1,50 @@
-from PIL import Image
+from PIL import Image, ImageOps
 from io import BytesIO
+import os
+import subprocess
+from threading import BoundedSemaphore
 import pytesseract
 
 from .ocrengine import OCREngine
 
+
 class Tesseract(OCREngine):
-    def __init__(self, path:str = None) -> None:
-        if (path != None):
+    def __init__(
+        self,
+        path: str = None,
+        highThroughput: bool = False,
+        workers: int = None,
+        grayscale: bool = False,
+        binarize: int = None,
+        targetDPI: int = None,
+        psm: int = None,
+        lang: str = None,
+        timeout: float = None,
+    ) -> None:
+        """Tesseract OCR engine.
+
+        Args:
+            path (str, optional): Path to the tesseract binary. Defaults to None (found on PATH).
+            highThroughput (bool, optional): Pipes images to tesseract through stdin/stdout instead of temp files, with at most workers recognitions running at once. Still one process per image. Defaults to False.
+            workers (int, optional): Concurrent tesseract processes in high throughput mode. Defaults to None (number of cores).
+            grayscale (bool, optional): Converts images to grayscale before recognition. Defaults to False.
+            binarize (int, optional): Threshold (0-255) to binarize grayscale images at. Defaults to None (no binarization).
+            targetDPI (int, optional): Downscales images whose DPI metadata is above this to this DPI. Defaults to None (no scaling).
+            psm (int, optional): Tesseract page segmentation mode. Defaults to None (tesseract's default).
+            lang (str, optional): Tesseract language(s), e.g. "eng+fra". Defaults to None (tesseract's default).
+            timeout (float, optional): Seconds a recognition may take before it is killed. Defaults to None (no limit).
+        """
+        if path != None:
             self._setTesseract(path)
+        self.highThroughput = highThroughput
+        self.workers = workers if workers != None else os.cpu_count() or 1
+        self.slots = BoundedSemaphore(self.workers)
+        self.grayscale = grayscale
+        self.binarize = binarize
+        self.targetDPI = targetDPI
+        self.psm = psm
+        self.lang = lang
+        self.timeout = timeout
         return None
 
     def _setTesseract(self, path: str) -> bool:
@@ -15,6 +52,81 @@ class Tesseract(OCREngine):
         pytesseract.pytesseract.tesseract_cmd = path
         return True
 
+    def getIdentity(self) -> str:
+        # preprocessing and recognition settings change the output, the transport does not
+        identity = f"Tesseract:{pytesseract.get_tesseract_version()}"
+        settings = [
+            ("gray", self.grayscale or self.binarize != None),
+            ("bin", self.binarize),
+            ("dpi", self.targetDPI),
+            ("psm", self.psm),
+            ("lang", self.lang),
+        ]
+        for name, value in settings:
+            if value not in (None, False):
+                identity += f":{name}={value}"
+        return identity
+
+    def preprocess(self, image: Image.Image) -> Image.Image:
+        """Applies the configured preprocessing to an image before recognition.
+
+        Args:
+            image (Image.Image): Decoded image.
+
+        Returns:
+            Image.Image: Preprocessed image. The same image if no preprocessing is configured.
+        """
+        if self.targetDPI != None and "dpi" in image.info:
+            dpi = max(image.info["dpi"])
+            if dpi > self.targetDPI:
+                scale = self.targetDPI / dpi
+                size = (
+                    max(1, round(image.width * scale)),
+                    max(1, round(image.height * scale)),
+                )
+                image = image.resize(size, Image.LANCZOS)
+        if self.grayscale or self.binarize != None:
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGBA", image.size, "white")
+                image = Image.alpha_composite(background, image)
+            image = ImageOps.grayscale(image)
+        if self.binarize != None:
+            threshold = self.binarize
+            image = image.point(lambda p: 255 if p > threshold else 0, mode="1")
+        return image
+
+    def __recognize(self, image: Image.Image) -> str:
+        # same preparation pytesseract applies before writing its temp file, so tesseract is given the same image
+        image, extension = pytesseract.pytesseract.prepare(image)
+        buffer = BytesIO()
+        image.save(buffer, format=extension)
+        args = [pytesseract.pytesseract.tesseract_cmd, "stdin", "stdout"]
+        if self.lang != None:
+            args += ["-l", self.lang]
+        if self.psm != None:
+            args += ["--psm", str(self.psm)]
+        env = dict(os.environ)
+        # one thread per process, the concurrent calls already spread work across the cores
+        env["OMP_THREAD_LIMIT"] = "1"
+        with self.slots:
+            result = subprocess.run(
+                args,
+                input=buffer.getvalue(),
+                capture_output=True,
+                env=env,
+                timeout=self.timeout,
+            )
+        if result.returncode != 0:
+            error = result.stderr.decode("utf-8", "replace").strip()
+            raise Exception(f"tesseract failed ({result.returncode}): {error}")
+        return result.stdout.decode("utf-8")
+
     def genChars(self, imgData: bytes, src: str, context: str = None) -> str:
-        image = Image.open(BytesIO(imgData))
-        return pytesseract.image_to_string(image)
\ No newline at end of file
+        image = self.preprocess(Image.open(BytesIO(imgData)))
+        if self.highThroughput:
+            return self.__recognize(image)
+        config = f"--psm {self.psm}" if self.psm != None else ""
+        return pytesseract.image_to_string(
+            image, lang=self.lang, config=config, timeout=self.timeout or 0
+        )
@@ -0,0 +1,96 @@
+from io import BytesIO
+from threading import Lock
+
+from PIL import Image, ImageFilter, ImageOps, ImageStat
+
+from .ocrengine import OCREngine
+
+
+class TextPrefilter(OCREngine):
+    def __init__(
+        self,
+        ocrEngine: OCREngine,
+        threshold: float = 0.25,
+        minDensity: float = 0.02,
+        thumbnailSize: int = 256,
+    ) -> None:
+        """Skips OCR on images that are unlikely to contain text.
+
+        Text shows up as bands of dense edges separated by blank lines, so the score is how unevenly edges are spread across the rows of a thumbnail.
+        Engravings and photographs spread edges evenly and score low, and rows filled from end to end, such as rules and hatching, are ignored.
+
+        Args:
+            ocrEngine (OCREngine): Engine used for images that pass the filter.
+            threshold (float, optional): Minimum text score for an image to be sent to ocrEngine. Defaults to 0.25.
+            minDensity (float, optional): Fraction of edge pixels, within the box the edges span, below which an image is considered blank. Defaults to 0.02.
+            thumbnailSize (int, optional): Longest side in pixels the image is reduced to before scoring. Defaults to 256.
+        """
+        self.ocrEngine = ocrEngine
+        self.threshold = threshold
+        self.minDensity = minDensity
+        self.thumbnailSize = thumbnailSize
+        self.calls = 0
+        self.skipped = 0
+        self.statsLock = Lock()
+        return None
+
+    def getIdentity(self) -> str:
+        # skipped images produce empty characters, so the filter settings change the output
+        return f"{self.ocrEngine.getIdentity()}:prefilter={self.threshold},{self.minDensity},{self.thumbnailSize}"
+
+    def getTextScore(self, imgData: bytes) -> float:
+        """Scores how likely an image is to contain text.
+
+        Args:
+            imgData (bytes): Image data in bytes.
+
+        Returns:
+            float: Text score, the coefficient of variation of edge density across rows. 0 for blank images and plain hatching.
+        """
+        image = Image.open(BytesIO(imgData))
+        image.draft("L", (self.thumbnailSize, self.thumbnailSize))
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGBA", image.size, "white")
+            image = Image.alpha_composite(background, image)
+        image = ImageOps.grayscale(image)
+        image.thumbnail((self.thumbnailSize, self.thumbnailSize))
+
+        # FIND_EDGES leaves the outermost pixels unfiltered, so they are cropped off
+        edges = image.filter(ImageFilter.FIND_EDGES)
+        if edges.width > 2 and edges.height > 2:
+            edges = edges.crop((1, 1, edges.width - 1, edges.height - 1))
+        edges = edges.point(lambda p: 255 if p > 64 else 0)
+        # density is measured where the edges are, so a single letter or a short label on a plain page still counts
+        box = edges.getbbox()
+        if box == None:
+            return 0.0
+        if ImageStat.Stat(edges.crop(box)).mean[0] / 255 < self.minDensity:
+            return 0.0
+
+        # rows are measured across the width the edges span; text never fills a row from end to end,
+        # so a row that nearly does is a rule or a line of hatching and is left out
+        rows = edges.crop((box[0], 0, box[2], edges.height))
+        rows = rows.resize((1, rows.height), Image.BOX)
+        rows = ImageStat.Stat(rows.point(lambda p: 0 if p > 0.9 * 255 else p))
+        if rows.mean[0] == 0:
+            return 0.0
+        return rows.stddev[0] / rows.mean[0]
+
+    def genChars(self, imgData: bytes, src: str, context: str = None) -> str:
+        with self.statsLock:
+            self.calls += 1
+        if self.getTextScore(imgData) < self.threshold:
+            with self.statsLock:
+                self.skipped += 1
+            return ""
+        return self.ocrEngine.genChars(imgData, src, context)
+
+    def getStats(self) -> dict:
+        """Gets how many images the filter has seen and how many OCR calls it skipped.
+
+        Returns:
+            dict: {"calls": int, "skipped": int}
+        """
+        with self.statsLock:
+            return {"calls": self.calls, "skipped": self.skipped}
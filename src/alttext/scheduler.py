@@ -0,0 +1,179 @@
+import time
+import typing
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+
+class Scheduler:
+    def __init__(
+        self, maxWorkers: int = 8, queueDepth: int = 16, taskTimeout: float = None
+    ) -> None:
+        """Bounded worker pool used to run generation tasks concurrently.
+
+        Args:
+            maxWorkers (int, optional): Number of tasks allowed to run at once. Defaults to 8.
+            queueDepth (int, optional): Number of submitted tasks allowed to wait for a free worker. Defaults to 16.
+            taskTimeout (float, optional): Seconds a running task may take before it is abandoned. An abandoned task's thread cannot be stopped, so a new thread takes its place. Defaults to None (no limit).
+        """
+        if maxWorkers < 1:
+            raise Exception("maxWorkers must be at least 1")
+        if queueDepth < 0:
+            raise Exception("queueDepth must not be negative")
+        self.maxWorkers = maxWorkers
+        self.queueDepth = queueDepth
+        self.taskTimeout = taskTimeout
+        return None
+
+    def map(
+        self,
+        fn: typing.Callable,
+        items: list,
+        onError: typing.Callable = None,
+    ) -> list:
+        """Runs fn on every item and returns the results in the same order as items.
+
+        Args:
+            fn (typing.Callable): Function to run on each item.
+            items (list): Items to process.
+            onError (typing.Callable, optional): Called as onError(item, exception) for a failed or timed out task; its return value takes the task's place in the results. Defaults to None, which raises the first failure once all tasks have settled.
+
+        Returns:
+            list: Results of fn, ordered as items.
+        """
+        errors = []
+
+        def collect(item, err: Exception):
+            errors.append(err)
+            return None
+
+        results = list(self.imap(fn, items, onError if onError != None else collect))
+        if len(errors) > 0:
+            raise errors[0]
+        return results
+
+    def imap(
+        self,
+        fn: typing.Callable,
+        items: typing.Iterable,
+        onError: typing.Callable = None,
+    ) -> typing.Iterator:
+        """Runs fn on every item, yielding results in the same order as items as soon as each is ready.
+        Items are taken from the iterable only as workers free up, so it may be a generator that is still producing them.
+
+        Args:
+            fn (typing.Callable): Function to run on each item.
+            items (typing.Iterable): Items to process.
+            onError (typing.Callable, optional): Called as onError(item, exception) for a failed or timed out task; its return value is yielded in the task's place. Defaults to None, which raises the failure when its result is reached.
+
+        Returns:
+            typing.Iterator: Results of fn, ordered as items.
+        """
+        iterator = iter(items)
+        started: dict[int, float] = {}
+        timedOut: set[int] = set()
+
+        def run(i: int, item):
+            started[i] = time.monotonic()
+            return fn(item)
+
+        # each pool is [executor, threads, futures given to it]; an abandoned task keeps its thread busy,
+        # so a replacement pool of one thread is added for it and "maxWorkers" tasks can still run
+        pools = [
+            [ThreadPoolExecutor(max_workers=self.maxWorkers), self.maxWorkers, set()]
+        ]
+
+        def submit(i: int, item) -> Future:
+            for pool in pools:
+                pool[2] = {f for f in pool[2] if not f.done()}
+                if len(pool[2]) < pool[1]:
+                    future = pool[0].submit(run, i, item)
+                    pool[2].add(future)
+                    return future
+            return None
+
+        # entries are [index, item, future], future is None until a worker is free
+        window: deque[list] = deque()
+        nextIndex = 0
+        exhausted = False
+        abandoned = False
+        try:
+            while True:
+                while not exhausted and len(window) < self.maxWorkers + self.queueDepth:
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    window.append([nextIndex, item, None])
+                    nextIndex += 1
+                if len(window) == 0:
+                    break
+
+                active = sum(
+                    1
+                    for j, _, f in window
+                    if f != None and j not in timedOut and not f.done()
+                )
+                for entry in window:
+                    if active >= self.maxWorkers:
+                        break
+                    if entry[2] == None:
+                        entry[2] = submit(entry[0], entry[1])
+                        if entry[2] == None:
+                            break
+                        active += 1
+
+                i, item, future = window[0]
+                if i in timedOut or (future != None and future.done()):
+                    window.popleft()
+                    if i in timedOut:
+                        err = TimeoutError(
+                            f"task timed out after {self.taskTimeout} seconds"
+                        )
+                    else:
+                        err = future.exception()
+                    if err == None:
+                        yield future.result()
+                    elif onError == None:
+                        raise err
+                    else:
+                        yield onError(item, err)
+                    continue
+
+                running = [
+                    (j, f)
+                    for j, _, f in window
+                    if f != None and j not in timedOut and not f.done()
+                ]
+                wait(
+                    [f for _, f in running],
+                    timeout=self.__nextDeadline(started, [j for j, _ in running]),
+                    return_when=FIRST_COMPLETED,
+                )
+
+                if self.taskTimeout != None:
+                    now = time.monotonic()
+                    for j, f in running:
+                        if not f.done() and j in started:
+                            if now - started[j] > self.taskTimeout:
+                                # a running thread cannot be killed, only abandoned
+                                f.cancel()
+                                timedOut.add(j)
+                                abandoned = True
+                                pools.append(
+                                    [ThreadPoolExecutor(max_workers=1), 1, set()]
+                                )
+        finally:
+            for pool in pools:
+                pool[0].shutdown(wait=not abandoned, cancel_futures=True)
+
+    def __nextDeadline(self, started: dict[int, float], pending: list[int]):
+        if self.taskTimeout == None:
+            return None
+        now = time.monotonic()
+        remaining = [
+            started[i] + self.taskTimeout - now for i in pending if i in started
+        ]
+        if len(remaining) == 0:
+            return self.taskTimeout
+        return max(min(remaining), 0.01)
@@ -5,16 +5,19 @@ import os
 import sys
 import time
 import csv
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
 
 import keys
 
 sys.path.append("../")
-from src.alttext.alttext import AltTextHTML
+from src.alttext.alttext import AltTextHTML, AltTextEPUB
 from src.alttext.descengine.descengine import DescEngine
 from src.alttext.descengine.replicateapi import ReplicateAPI
 from src.alttext.descengine.bliplocal import BlipLocal
 from src.alttext.descengine.googlevertexapi import GoogleVertexAPI
 from src.alttext.ocrengine.tesseract import Tesseract
+from src.alttext.ocrengine.textprefilter import TextPrefilter
 from src.alttext.langengine.openaiapi import OpenAIAPI
 from src.alttext.langengine.privategpt import PrivateGPT
 
@@ -52,12 +55,13 @@ class AltTextGenerator(AltTextHTML):
 
         # Refinement processing timing
         # print("starting refinement")
+        # the prompt builder bounds context and OCR text to its token budgets
         refine_start_time = time.time()
-        if context[0] is not None:
-            context[0] = context[0][:1000]
-        if context[1] is not None:
-            context[1] = context[1][:1000]
-        refined_desc = self.langEngine.refineAlt(genDesc, chars[:1000], context, None)
+        tokens_before = self.langEngine.getPromptBuilder().getStats()["tokens"]
+        refined_desc = self.langEngine.refineAlt(genDesc, chars, context, None)
+        refine_tokens = (
+            self.langEngine.getPromptBuilder().getStats()["tokens"] - tokens_before
+        )
         refine_end_time = time.time()
         refine_total_time = refine_end_time - refine_start_time
 
@@ -80,6 +84,7 @@ class AltTextGenerator(AltTextHTML):
             "genOCR-Time": ocr_total_time,
             "refineDesc": refined_desc,
             "refineDesc-Time": refine_total_time,
+            "refineDesc-Tokens": refine_tokens,
             "totalTime": total_overall_time,
         }
 
@@ -88,6 +93,18 @@ class AltTextGenerator(AltTextHTML):
         return record
 
 
+def findBookFile(booksDir: str, bookId: str) -> str:
+    # books are read straight from their downloaded zip, or from a folder they were extracted to
+    zipPath = os.path.join(booksDir, f"{bookId}.zip")
+    if os.path.isfile(zipPath):
+        return zipPath
+    bookPath = os.path.join(booksDir, bookId)
+    for object in os.listdir(bookPath):
+        if object.endswith(".html"):
+            return os.path.join(bookPath, object)
+    return None
+
+
 def generateCSV(csv_file_path: str, benchmark_records: list[dict]):
     fieldnames = benchmark_records[0].keys()
 
@@ -114,14 +131,8 @@ def benchmarkBooks(booksDir: str, srcsDir: str):
         bookId = bookId.split("_")[1].split(".")[0]
         time.sleep(1)
         try:
-            bookPath = os.path.join(booksDir, bookId)
-
-            htmlpath = None
-            for object in os.listdir(bookPath):
-                if object.endswith(".html"):
-                    htmlpath = os.path.join(bookPath, object)
-                    break
-            generator.parseFile(htmlpath)
+            bookPath = findBookFile(booksDir, bookId)
+            generator.parseFile(bookPath)
 
             srcs = []
             with open(f"{srcsDir}/ebook_{bookId}.txt", "r") as file:
@@ -150,14 +161,8 @@ def benchmarkDescEngine(
         bookId = bookId.split("_")[1].split(".")[0]
         try:
             print("STARTING BOOK ID: ", bookId)
-            bookPath = os.path.join(booksDir, bookId)
-
-            htmlpath = None
-            for object in os.listdir(bookPath):
-                if object.endswith(".html"):
-                    htmlpath = os.path.join(bookPath, object)
-                    break
-            generator.parseFile(htmlpath)
+            bookPath = findBookFile(booksDir, bookId)
+            generator.parseFile(bookPath)
 
             srcs = []
             with open(f"{srcsDir}/ebook_{bookId}.txt", "r") as file:
@@ -194,6 +199,146 @@ def benchmarkDescEngine(
     generateCSV(outputFilename, records)
 
 
+def loadBookImages(booksDir: str, srcsDir: str) -> list[tuple[str, str, bytes]]:
+    generator = AltTextHTML(None)
+
+    images = []
+    for bookId in os.listdir(srcsDir):
+        bookId = bookId.split("_")[1].split(".")[0]
+        try:
+            bookPath = findBookFile(booksDir, bookId)
+            generator.parseFile(bookPath)
+
+            with open(f"{srcsDir}/ebook_{bookId}.txt", "r") as file:
+                for line in file:
+                    src = line.split(f"{bookId}/")[1].strip()
+                    images.append((bookId, src, generator.getImgData(src)))
+        except Exception as e:
+            print(f"ERROR loading book {bookId}: {e}")
+    return images
+
+
+def benchmarkOCREngine(booksDir: str, srcsDir: str, outputFilename: str):
+    # compares the default Tesseract mode against the high throughput mode on the same images
+    images = loadBookImages(booksDir, srcsDir)
+    default = Tesseract()
+    fast = Tesseract(highThroughput=True)
+
+    default_start_time = time.time()
+    defaultChars = [default.genChars(data, src) for _, src, data in images]
+    default_total_time = time.time() - default_start_time
+
+    fast_start_time = time.time()
+    with ThreadPoolExecutor(max_workers=fast.workers) as executor:
+        fastChars = list(
+            executor.map(lambda image: fast.genChars(image[2], image[1]), images)
+        )
+    fast_total_time = time.time() - fast_start_time
+
+    records = []
+    for (bookId, src, _), a, b in zip(images, defaultChars, fastChars):
+        records.append(
+            {
+                "book": bookId,
+                "image": src,
+                "defaultOCR": a,
+                "fastOCR": b,
+                "match": a == b,
+            }
+        )
+    generateCSV(outputFilename, records)
+
+    matches = sum(1 for record in records if record["match"])
+    print(f"IMAGES: {len(images)} | MATCHING OUTPUT: {matches}")
+    print(
+        f"DEFAULT: {default_total_time:.2f}s | HIGH THROUGHPUT: {fast_total_time:.2f}s"
+    )
+    if fast_total_time > 0:
+        print(f"SPEEDUP: {default_total_time / fast_total_time:.2f}x")
+
+
+def validateTextPrefilter(labelsPath: str, booksDir: str, threshold: float = 0.25):
+    # labelsPath is a CSV with columns book, image and hasText (1 if the image contains text)
+    prefilter = TextPrefilter(Tesseract(), threshold)
+    generator = AltTextHTML(None)
+
+    truePositive = falsePositive = trueNegative = falseNegative = 0
+    currentBook = None
+    with open(labelsPath, mode="r") as csvfile:
+        for row in csv.DictReader(csvfile):
+            try:
+                if row["book"] != currentBook:
+                    currentBook = row["book"]
+                    generator.parseFile(findBookFile(booksDir, currentBook))
+                score = prefilter.getTextScore(generator.getImgData(row["image"]))
+                predicted = score >= threshold
+                actual = row["hasText"] == "1"
+                if predicted and actual:
+                    truePositive += 1
+                elif predicted:
+                    falsePositive += 1
+                elif actual:
+                    falseNegative += 1
+                else:
+                    trueNegative += 1
+            except Exception as e:
+                print(f"ERROR processing image {row['book']} | {row['image']}: {e}")
+
+    total = truePositive + falsePositive + trueNegative + falseNegative
+    print(f"IMAGES: {total} | OCR CALLS SAVED: {trueNegative + falseNegative}")
+    print(f"TEXT IMAGES MISSED: {falseNegative} | NO-TEXT IMAGES KEPT: {falsePositive}")
+    if truePositive + falseNegative > 0:
+        print(f"RECALL: {truePositive / (truePositive + falseNegative):.3f}")
+
+
+def measure(fn) -> tuple[float, int]:
+    tracemalloc.start()
+    start_time = time.time()
+    fn()
+    total_time = time.time() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return total_time, peak
+
+
+def benchmarkParsers(htmlPath: str, epubPath: str):
+    # compares parse time and peak memory of each parser backend and of img-only EPUB scanning
+    parsers = ["html.parser"]
+    try:
+        import lxml
+
+        parsers.append("lxml")
+    except ImportError:
+        print("lxml is not installed, only html.parser is measured")
+
+    def parseHTML(parser: str):
+        generator = AltTextHTML(None, options={"parser": parser})
+        generator.parseFile(htmlPath)
+        return generator.getAllImgs()
+
+    def parseEPUB(parser: str, imgScan: bool):
+        generator = AltTextEPUB(options={"parser": parser, "imgScan": imgScan})
+        generator.parseFile(epubPath)
+        return generator.getAllImgs()
+
+    runs = []
+    for parser in parsers:
+        runs.append((f"HTML {parser}", lambda parser=parser: parseHTML(parser)))
+    for parser in parsers:
+        for imgScan in [False, True]:
+            mode = "img scan" if imgScan else "full"
+            runs.append(
+                (
+                    f"EPUB {parser} {mode}",
+                    lambda parser=parser, imgScan=imgScan: parseEPUB(parser, imgScan),
+                )
+            )
+
+    for name, run in runs:
+        total_time, peak = measure(run)
+        print(f"{name}: {total_time:.3f}s | PEAK MEMORY: {peak / 1024 / 1024:.1f} MiB")
+
+
 if __name__ == "__main__":
     print("RUNNING AUTOMATE.PY")
     benchmarkBooks("./downloaded_books", "./book_outputs")
@@ -207,3 +352,6 @@ if __name__ == "__main__":
     #     "./book_outputs2",
     #     "vertexai.csv",
     # )
+    # benchmarkOCREngine("./downloaded_books", "./book_outputs", "tesseract.csv")
+    # validateTextPrefilter("./text_labels.csv", "./downloaded_books")
+    # benchmarkParsers("./downloaded_books/<id>.zip", "./<id>.epub")
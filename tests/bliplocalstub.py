@@ -0,0 +1,95 @@
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append("../")
+import src.alttext.descengine.bliplocal as bliplocal
+from src.alttext.descengine.bliplocal import BlipLocal
+
+# checks BlipLocal against a local fake of the image-captioning fork's inference.py
+# the fake captions every image in the folder as "caption of <bytes>", and exits with status 1 if an image is b"crash"
+
+INFERENCE = """import argparse, glob, os, sys
+parser = argparse.ArgumentParser()
+parser.add_argument("-i")
+parser.add_argument("--batch")
+parser.add_argument("--gpu")
+args = parser.parse_args()
+open("runs.txt", "a").write("run\\n")
+lines = []
+for path in sorted(glob.glob(os.path.join(args.i, "*.*"))):
+    data = open(path, "rb").read()
+    if data == b"crash":
+        sys.exit(1)
+    if data != b"blank":
+        lines.append(f"{path},caption of {data.decode()}")
+open(os.path.join(args.i, "0_captions.txt"), "w").write("\\n".join(lines))
+"""
+
+
+CALL = subprocess.call
+
+
+def call(command: str, cwd: str) -> int:
+    # "py" is the Windows launcher; run the fake with this interpreter instead
+    args = shlex.split(command)
+    return CALL([sys.executable] + args[1:], cwd=cwd)
+
+
+def getEngine(path: str, **kwargs) -> BlipLocal:
+    open(os.path.join(path, "inference.py"), "w").write(INFERENCE)
+    subprocess.call = call
+    return BlipLocal(path, **kwargs)
+
+
+def getRuns(path: str) -> int:
+    runsPath = os.path.join(path, "runs.txt")
+    if not os.path.isfile(runsPath):
+        return 0
+    return len(open(runsPath).read().splitlines())
+
+
+def testGenDescShared():
+    print("TESTING GENDESC SHARED RUNS")
+    with tempfile.TemporaryDirectory() as path:
+        engine = getEngine(path, batchWait=0.2)
+        images = [(f"img{i}".encode(), f"img{i}.png") for i in range(16)]
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            descs = list(executor.map(lambda image: engine.genDesc(*image), images))
+        assert descs == [f"caption of img{i}" for i in range(16)], descs
+        # concurrent calls share inference.py runs instead of starting one each
+        assert getRuns(path) < 4, getRuns(path)
+
+        try:
+            engine.genDesc(b"blank", "blank.png")
+            raise AssertionError("expected a missing caption to raise")
+        except Exception as err:
+            assert str(err) == "BLIP produced no caption for blank.png", err
+
+
+def testFailedRun():
+    print("TESTING FAILED RUN")
+    with tempfile.TemporaryDirectory() as path:
+        engine = getEngine(path, batchWait=0.2)
+        images = [(b"ok", "ok.png"), (b"crash", "crash.png")]
+        try:
+            engine.genDescMany(images)
+            raise AssertionError("expected a failed run to raise")
+        except Exception as err:
+            assert str(err) == "inference.py exited with status 1", err
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(engine.genDesc, *image) for image in images]
+        for future in futures:
+            assert str(future.exception()) == "inference.py exited with status 1"
+        # no folder of images is left behind
+        assert sorted(os.listdir(path)) == ["inference.py", "runs.txt"]
+
+
+if __name__ == "__main__":
+    testGenDescShared()
+    testFailedRun()
+    print("OK")
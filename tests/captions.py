@@ -0,0 +1,53 @@
+import sys
+
+sys.path.append("../")
+import src.alttext.alttext as alttext
+
+# checks which caption, if any, getCaption finds for each image
+
+CHAPTER = """<html><body><div class="chapter">
+<p>Intro.</p>
+<figure><img src="a.png"/><figcaption>Fig 1. A bird</figcaption></figure>
+<p><img src="b.png"/></p>
+<p class="caption">Fig 2. A map</p>
+<p>Between.</p>
+<p><img src="c.png"/></p>
+<div class="figcenter"><img src="d.png"/><p class="caption">Fig 3. A boat</p></div>
+<figure><img src="e.png"/><img src="f.png"/><figcaption>Fig 4. Two plates</figcaption></figure>
+<figure><figure><img src="g.png"/><figcaption>Fig 5a</figcaption></figure><figcaption>Fig 5</figcaption></figure>
+<figure><div><img src="h.png"/></div><figcaption>Fig 6. Nested</figcaption></figure>
+<table><caption>Table 1</caption><tr><td><img src="i.png"/></td></tr></table>
+</div>
+<p class="caption">Loose caption</p>
+<p><img src="j.png"/></p>
+</body></html>"""
+
+EXPECTED = {
+    "a.png": "Fig 1. A bird",
+    # the chapter's caption is not the image's own, whichever side of it the image is on
+    "b.png": None,
+    "c.png": None,
+    "d.png": "Fig 3. A boat",
+    # a caption shared by several images is given to none of them
+    "e.png": None,
+    "f.png": None,
+    "g.png": "Fig 5a",
+    "h.png": "Fig 6. Nested",
+    "i.png": "Table 1",
+    # captions directly in <body> are never used
+    "j.png": None,
+}
+
+
+def testCaptions():
+    print("TESTING CAPTIONS")
+    alt = alttext.AltTextHTML(None)
+    alt.parse(CHAPTER)
+    for src, expected in EXPECTED.items():
+        caption = alt.getCaption(alt.getImg(src))
+        assert caption == expected, (src, caption, expected)
+
+
+if __name__ == "__main__":
+    testCaptions()
+    print("OK")
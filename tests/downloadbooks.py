@@ -1,23 +1,20 @@
-# The goal of this file is to download the books and unzip them to be used by automate.py!
+# The goal of this file is to download the books to be used by automate.py!
+# AltTextHTML reads the zipped books directly, so they are not extracted.
 
 import os
 import requests
-import zipfile
 import re
 
 folder_path = "book_outputs"
-download_folder = "downloaded_books/download_files"
-extraction_folder = "downloaded_books"
+download_folder = "downloaded_books"
 
 
-def downloadAndUnzipBooks(folder_path, download_folder, extraction_folder):
+def downloadBooks(folder_path, download_folder):
     base_url = "https://www.gutenberg.org/cache/epub/{book_id}/pg{book_id}-h.zip"
 
-    # Ensure the download and extraction folders exist
+    # Ensure the download folder exists
     if not os.path.exists(download_folder):
         os.makedirs(download_folder)
-    if not os.path.exists(extraction_folder):
-        os.makedirs(extraction_folder)
 
     # Iterate through each text file in the folder
     for filename in os.listdir(folder_path):
@@ -47,26 +44,9 @@ def downloadAndUnzipBooks(folder_path, download_folder, extraction_folder):
                         print(f"Error downloading {book_id}.zip: {e}")
                 else:
                     print(f"{book_id}.zip already exists. Skipping download.")
-
-                # Check if the book's extraction folder already exists
-                book_extraction_folder = os.path.join(extraction_folder, book_id)
-                if not os.path.exists(book_extraction_folder):
-                    try:
-                        # Unzip the file into the specified extraction folder
-                        with zipfile.ZipFile(zip_file_path, "r") as zip_ref:
-                            zip_ref.extractall(book_extraction_folder)
-                        print(f"Extracted {book_id}.zip to {book_extraction_folder}.")
-                    except zipfile.BadZipFile:
-                        print(
-                            f"Error unzipping {book_id}.zip: The file may be corrupt or not a zip file."
-                        )
-                else:
-                    print(
-                        f"Extraction folder for {book_id} already exists. Skipping extraction."
-                    )
             else:
                 print(f"No book ID found in {filename}")
 
 
 if __name__ == "__main__":
-    downloadAndUnzipBooks(folder_path, download_folder, extraction_folder)
+    downloadBooks(folder_path, download_folder)
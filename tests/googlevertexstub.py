@@ -0,0 +1,77 @@
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append("../")
+import src.alttext.descengine.googlevertexapi as googlevertexapi
+from src.alttext.descengine.googlevertexapi import GoogleVertexAPI
+
+# checks GoogleVertexAPI against a local stub of the Vertex AI image captioning model
+
+
+class StubModel:
+    resolved = 0
+    lock = threading.Lock()
+
+    @classmethod
+    def from_pretrained(cls, name: str) -> "StubModel":
+        with cls.lock:
+            cls.resolved += 1
+        # slow enough that threads racing to resolve the model overlap
+        time.sleep(0.2)
+        return cls()
+
+    def get_captions(self, image, number_of_results: int, language: str) -> list[str]:
+        # answers arrive out of order
+        time.sleep(random.uniform(0, 0.05))
+        data = image._image_bytes
+        if data.startswith(b"fail"):
+            raise Exception("stub failure")
+        return [f"caption of {data.decode()}"]
+
+
+def getEngine() -> GoogleVertexAPI:
+    googlevertexapi.ImageTextModel = StubModel
+    googlevertexapi.vertexai.init = lambda **kwargs: None
+    StubModel.resolved = 0
+    return GoogleVertexAPI("project", "us-central1", "gac.json", batchWorkers=8)
+
+
+def testModelResolvedOnce():
+    print("TESTING MODEL RESOLUTION")
+    engine = getEngine()
+    images = [(f"img{i}".encode(), f"img{i}.png") for i in range(32)]
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        descs = list(executor.map(lambda image: engine.genDesc(*image), images))
+    assert StubModel.resolved == 1, StubModel.resolved
+    assert descs == [f"caption of img{i}" for i in range(32)]
+
+    # changing the credentials resolves the model again, once
+    engine._GoogleVertexAPI__setGAC("other.json")
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(lambda image: engine.genDesc(*image), images))
+    assert StubModel.resolved == 2, StubModel.resolved
+
+
+def testGenDescManyOrder():
+    print("TESTING GENDESCMANY ORDER")
+    engine = getEngine()
+    images = [(f"img{i}".encode(), f"img{i}.png") for i in range(50)]
+    images[7] = (b"fail7", "fail7.png")
+    descs = engine.genDescMany(images)
+    assert StubModel.resolved == 1, StubModel.resolved
+    for i, desc in enumerate(descs):
+        if i == 7:
+            # a failed image is left to be described individually
+            assert desc == None, desc
+        else:
+            assert desc == f"caption of img{i}", (i, desc)
+    assert engine.genDescMany([]) == []
+
+
+if __name__ == "__main__":
+    testModelResolvedOnce()
+    testGenDescManyOrder()
+    print("OK")
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import requests
+
+sys.path.append("../")
+from src.alttext.langengine.privategpt import PrivateGPT
+
+# checks PrivateGPT's retries against a local stub of the PrivateGPT API server
+
+# prompt -> number of 503 responses before answering
+UNAVAILABLE = {}
+# prompts answered only after this many seconds
+SLOW = 2.0
+SEEN = {}
+SEEN_LOCK = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["prompt"]
+        with SEEN_LOCK:
+            SEEN[prompt] = SEEN.get(prompt, 0) + 1
+            attempt = SEEN[prompt]
+        if attempt <= UNAVAILABLE.get(prompt, 0):
+            return self.__reply(503, {"detail": "unavailable"})
+        if prompt.startswith("slow"):
+            time.sleep(SLOW)
+        content = {"choices": [{"message": {"content": f" echo {prompt} "}}]}
+        return self.__reply(200, content)
+
+    def __reply(self, status: int, content: dict):
+        data = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except BrokenPipeError:
+            # the client timed out and hung up
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def startStub() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def getEngine(server: ThreadingHTTPServer, retries: int = 3) -> PrivateGPT:
+    host = f"http://127.0.0.1:{server.server_address[1]}"
+    return PrivateGPT(host, poolSize=4, timeout=(1, 0.5), retries=retries, backoff=0)
+
+
+def testRetries(server: ThreadingHTTPServer):
+    print("TESTING RETRIES ON 503")
+    engine = getEngine(server)
+    UNAVAILABLE["flaky"] = 2
+    assert engine._completion("flaky") == "echo flaky"
+    stats = engine.getPoolStats()
+    assert stats["requests"] == 3 and stats["retries"] == 2, stats
+    assert stats["failures"] == 0, stats
+
+    UNAVAILABLE["down"] = 100
+    try:
+        engine._completion("down")
+        raise AssertionError("expected an HTTPError")
+    except requests.HTTPError as err:
+        assert err.response.status_code == 503
+    assert SEEN["down"] == 4, SEEN["down"]
+    assert engine.getPoolStats()["failures"] == 1
+
+
+def testTimeouts(server: ThreadingHTTPServer):
+    print("TESTING TIMEOUTS")
+    engine = getEngine(server, retries=1)
+    try:
+        engine._completion("slow sync")
+        raise AssertionError("expected a Timeout")
+    except requests.Timeout:
+        pass
+    assert SEEN["slow sync"] == 2, SEEN["slow sync"]
+    stats = engine.getPoolStats()
+    assert stats["retries"] == 1 and stats["failures"] == 1, stats
+
+
+def testAsync(server: ThreadingHTTPServer):
+    print("TESTING ASYNC")
+    engine = getEngine(server, retries=1)
+    UNAVAILABLE["flaky async"] = 1
+
+    async def run():
+        await engine.openAsync()
+        try:
+            client = engine._getAsyncClient()
+            assert await engine._completionAsync("flaky async") == "echo flaky async"
+            try:
+                await engine._completionAsync("slow async")
+                raise AssertionError("expected a TimeoutException")
+            except httpx.TimeoutException:
+                pass
+            # the same client serves the whole run
+            assert engine._getAsyncClient() is client
+        finally:
+            await engine.closeAsync()
+        return client
+
+    for _ in range(2):
+        # every asyncio.run is a new event loop, the client of the last one must be closed
+        client = asyncio.run(run())
+        assert client.is_closed
+        assert len(engine.asyncClients) == 0
+    assert SEEN["slow async"] == 4, SEEN["slow async"]
+
+
+if __name__ == "__main__":
+    server = startStub()
+    try:
+        testRetries(server)
+        testTimeouts(server)
+        testAsync(server)
+        print("OK")
+    finally:
+        server.shutdown()
@@ -0,0 +1,125 @@
+import base64
+import sys
+
+from replicate.exceptions import ReplicateError
+
+sys.path.append("../")
+import src.alttext.descengine.replicateapi as replicateapi
+from src.alttext.descengine.replicateapi import ReplicateAPI
+
+# checks ReplicateAPI.genDescMany against a local fake of replicate.predictions
+# each image's bytes say how the fake treats its prediction:
+#   b"ok"            succeeds on the first poll
+#   b"flaky"         reload raises twice, then succeeds
+#   b"lost"          reload always raises
+#   b"failed"        the prediction fails
+#   b"slow"          never finishes
+#   b"reject"        create raises, as for an invalid input
+#   b"unauthorized"  create raises, as for a bad token
+# API errors are raised as replicate 0.23 does, a ReplicateError with only the response's detail
+
+
+class StubPrediction:
+    def __init__(self, kind: str, index: int) -> None:
+        self.kind = kind
+        self.index = index
+        self.status = "starting"
+        self.output = None
+        self.error = None
+        self.reloads = 0
+        self.canceled = False
+
+    def reload(self) -> None:
+        self.reloads += 1
+        if self.kind == "lost" or (self.kind == "flaky" and self.reloads <= 2):
+            raise ConnectionError("connection reset")
+        if self.kind in ("ok", "flaky"):
+            self.status = "succeeded"
+            # a streamed output is reported as a list of tokens
+            self.output = ["desc ", str(self.index)]
+        elif self.kind == "failed":
+            self.status = "failed"
+            self.error = "out of memory"
+        else:
+            self.status = "processing"
+
+    def cancel(self) -> None:
+        self.canceled = True
+        self.status = "canceled"
+
+
+class StubPredictions:
+    def __init__(self) -> None:
+        self.created = []
+
+    def create(self, version: str, input: dict) -> StubPrediction:
+        data = base64.b64decode(input["image"].split(",")[1]).decode()
+        kind, index = data.split(":")
+        if kind == "reject":
+            raise ReplicateError("invalid input")
+        if kind == "unauthorized":
+            raise ReplicateError("Invalid token.")
+        prediction = StubPrediction(kind, int(index))
+        self.created.append(prediction)
+        return prediction
+
+
+def getEngine(**kwargs) -> tuple[ReplicateAPI, StubPredictions]:
+    predictions = StubPredictions()
+    replicateapi.replicate.predictions = predictions
+    engine = ReplicateAPI("key", "blip", pollInterval=0, **kwargs)
+    return engine, predictions
+
+
+def getImages(kinds: list[str]) -> list[tuple[bytes, str]]:
+    return [(f"{kind}:{i}".encode(), f"{kind}{i}.png") for i, kind in enumerate(kinds)]
+
+
+def testGenDescMany():
+    print("TESTING GENDESCMANY")
+    engine, predictions = getEngine(maxInFlight=3, predictionTimeout=0.2)
+    kinds = ["ok", "flaky", "lost", "failed", "slow", "reject", "ok"]
+    descs = engine.genDescMany(getImages(kinds))
+    assert descs == ["desc 0", "desc 1", None, None, None, None, "desc 6"], descs
+
+    errors = engine.getErrors()
+    assert sorted(errors.keys()) == [2, 3, 4, 5], errors
+    assert errors[2].startswith("reload failed"), errors[2]
+    assert errors[3] == "prediction failed: out of memory", errors[3]
+    assert errors[4].startswith("prediction timed out"), errors[4]
+    assert errors[5] == "create failed: invalid input", errors[5]
+
+    byKind = {prediction.kind: prediction for prediction in predictions.created}
+    # a transient polling error does not drop the prediction
+    assert byKind["flaky"].reloads == 3 and not byKind["flaky"].canceled
+    # one that keeps failing is given up on after reloadRetries, and canceled
+    assert byKind["lost"].reloads == engine.reloadRetries + 1
+    assert byKind["lost"].canceled
+    assert byKind["slow"].canceled
+    assert not byKind["failed"].canceled
+
+
+def testFailFast():
+    print("TESTING FAIL FAST")
+    engine, predictions = getEngine(maxInFlight=8)
+    kinds = ["slow", "slow"] + ["unauthorized"] * 5 + ["ok"]
+    try:
+        engine.genDescMany(getImages(kinds))
+        raise AssertionError("expected the create error to be raised")
+    except ReplicateError as err:
+        assert str(err) == "Invalid token.", err
+    # creating stops after createFailures errors in a row, and nothing is left running
+    assert len(predictions.created) == 2
+    assert all(prediction.canceled for prediction in predictions.created)
+
+    # failures with successes between them are only recorded
+    engine, predictions = getEngine(maxInFlight=8)
+    descs = engine.genDescMany(getImages(["reject", "ok", "reject", "ok", "reject"]))
+    assert descs == [None, "desc 1", None, "desc 3", None], descs
+    assert sorted(engine.getErrors().keys()) == [0, 2, 4]
+
+
+if __name__ == "__main__":
+    testGenDescMany()
+    testFailFast()
+    print("OK")